@@ -0,0 +1,362 @@
+"""
+Benchmark the HTML parsers over a versioned corpus of detail and attachments pages.
+
+For every page in the corpus and every parser backend this measures the
+work the scraper does on it: parse_detail / parse_attachments, the ASP.NET
+form field extraction behind _extract_aspnet_form_fields, the incremental
+detail parser ('lxml-stream') and normalize_url on the URLs the page
+yields. Each measurement reports wall time over repeated runs and, from a
+separate traced run, Python heap allocations and peak memory:
+
+    python -m src.bench_parsers --repeat 20 --output bench.json
+    python -m src.bench_parsers --compare before.json bench.json
+
+Memory figures come from tracemalloc and only cover the Python heap;
+libxml2 allocates lxml's trees with malloc, so they never show up there.
+
+The corpus (benchmarks/corpus) holds gzipped pages plus manifest.json with
+the corpus version and a sha256 per page; results from different corpus
+versions are not comparable. Add real pages with:
+
+    python -m src.bench_parsers --capture 3707-351-AG25 1057-1234-SE25
+"""
+
+import argparse
+import asyncio
+import gc
+import gzip
+import hashlib
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import bs4
+from lxml import etree
+
+from .mercadopublico import MercadoPublicoScraper
+from .parsing import PARSERS, DetailStreamParser, normalize_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'corpus')
+STREAM_BACKEND = 'lxml-stream'
+
+
+def load_corpus(corpus_dir: str, names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Read manifest.json and the pages it lists, checking each page's sha256"""
+    with open(os.path.join(corpus_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    pages = []
+    for page in manifest['pages']:
+        if names and page['name'] not in names:
+            continue
+        with gzip.open(os.path.join(corpus_dir, f"{page['name']}.html.gz")) as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != page['sha256']:
+            raise ValueError(f"Corpus page {page['name']} does not match its manifest sha256; bump the corpus version")
+        pages.append({**page, 'html': data.decode('utf-8')})
+
+    if names and len(pages) != len(set(names)):
+        missing = set(names) - {page['name'] for page in pages}
+        raise ValueError(f"Pages not in corpus: {', '.join(sorted(missing))}")
+    return {**manifest, 'pages': pages}
+
+
+def _time(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Wall time of `repeat` calls after one warm-up call"""
+    func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return {
+        'min': round(min(samples), 6),
+        'median': round(statistics.median(samples), 6),
+        'mean': round(statistics.fmean(samples), 6),
+        'max': round(max(samples), 6),
+    }
+
+
+def _trace(func: Callable[[], Any]) -> Dict[str, int]:
+    """
+    Python heap usage of one call: peak bytes above the starting point,
+    and the bytes and blocks still allocated when it returns (its result)
+    """
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(ignore)
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+    finally:
+        tracemalloc.stop()
+    del result
+
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return {
+        'peak_bytes': peak - start,
+        'retained_bytes': current - start,
+        'retained_blocks': retained_blocks,
+    }
+
+
+def _measure(func: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    return {'wall_seconds': _time(func, repeat), **_trace(func)}
+
+
+def _stream_detail(html: str, base_url: str, chunk_size: int) -> Optional[Dict[str, Any]]:
+    """Feed a page to DetailStreamParser the way _stream_parse feeds a response"""
+    parser = DetailStreamParser(base_url)
+    for offset in range(0, len(html), chunk_size):
+        if parser.feed(html[offset:offset + chunk_size]):
+            break
+    return parser.close()
+
+
+def _page_urls(page: Dict[str, Any], result) -> List[str]:
+    """The URLs a page yields, as passed through normalize_url by the scraper"""
+    if page['kind'] == 'detail':
+        urls = [url for url in result.values() if url]
+    else:
+        attachments, _ = result
+        urls = [att['download_url'] for att in attachments if att['download_url']]
+    # Also the unresolved form the detail page links the attachments page with
+    return urls + [f"{url.rsplit('/', 1)[0]}/../../{url.rsplit('/', 1)[1]}" for url in urls]
+
+
+def bench_page(
+    page: Dict[str, Any],
+    base_url: str,
+    backends: List[str],
+    repeat: int,
+    chunk_size: int
+) -> Dict[str, Any]:
+    """Measure every operation of one page with each backend"""
+    html = page['html']
+    results: Dict[str, Dict[str, Any]] = {}
+    outputs = {}
+
+    for name in backends:
+        if name == STREAM_BACKEND:
+            if page['kind'] != 'detail':
+                continue
+            parse = lambda: _stream_detail(html, base_url, chunk_size)  # noqa: E731
+            results[name] = {'parse_detail': _measure(parse, repeat)}
+            outputs[name] = parse()
+            continue
+
+        parser = PARSERS[name]
+        if page['kind'] == 'detail':
+            operation = 'parse_detail'
+            parse = lambda: parser.parse_detail(html, base_url)  # noqa: E731
+        else:
+            operation = 'parse_attachments'
+            parse = lambda: parser.parse_attachments(html, page['url'], base_url)  # noqa: E731
+        results[name] = {
+            operation: _measure(parse, repeat),
+            'form_fields': _measure(lambda: parser.form_fields(html), repeat),
+        }
+        outputs[name] = parse()
+
+    report = {
+        'kind': page['kind'],
+        'source': page.get('source'),
+        'size': page['size'],
+        'backends': results,
+        'backends_agree': len({json.dumps(output, sort_keys=True) for output in outputs.values()}) <= 1,
+    }
+
+    reference = next(iter(outputs.values()), None)
+    urls = _page_urls(page, reference) if reference else []
+    if urls:
+        report['normalize_url'] = {
+            'urls': len(urls),
+            **_measure(lambda: [normalize_url(url) for url in urls], repeat)
+        }
+    return report
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    corpus_dir: str,
+    backends: List[str],
+    repeat: int = 10,
+    chunk_size: int = 64 * 1024,
+    names: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Benchmark the corpus and return the JSON report"""
+    corpus = load_corpus(corpus_dir, names)
+    pages = {}
+    for page in corpus['pages']:
+        logger.info(f"Benchmarking {page['name']} ({page['kind']}, {page['size']} bytes)")
+        pages[page['name']] = bench_page(page, corpus['base_url'], backends, repeat, chunk_size)
+
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'corpus': {'version': corpus['version'], 'pages': len(corpus['pages'])},
+        'settings': {'backends': backends, 'repeat': repeat, 'chunk_size': chunk_size},
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'lxml': '.'.join(map(str, etree.LXML_VERSION)),
+            'libxml2': '.'.join(map(str, etree.LIBXML_VERSION)),
+            'beautifulsoup4': bs4.__version__,
+        },
+        'pages': pages,
+    }
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]) -> List[str]:
+    """Median wall time and peak memory changes between two reports, one line per measurement"""
+    lines = []
+    if before['corpus']['version'] != after['corpus']['version']:
+        lines.append(
+            f"WARNING: corpus version {before['corpus']['version']} vs {after['corpus']['version']}, "
+            "numbers are not comparable"
+        )
+    lines.append(f"{before.get('commit')} -> {after.get('commit')}")
+
+    def row(label: str, old: Dict[str, Any], new: Dict[str, Any]):
+        old_time, new_time = old['wall_seconds']['median'], new['wall_seconds']['median']
+        change = (new_time / old_time - 1) * 100 if old_time else 0.0
+        lines.append(
+            f"{label:58s} {old_time * 1000:9.3f} ms -> {new_time * 1000:9.3f} ms ({change:+6.1f}%)  "
+            f"peak {old['peak_bytes']:>10,} -> {new['peak_bytes']:>10,} B"
+        )
+
+    for name, page in after['pages'].items():
+        old_page = before['pages'].get(name)
+        if not old_page:
+            continue
+        for backend, operations in page['backends'].items():
+            for operation, result in operations.items():
+                old = old_page['backends'].get(backend, {}).get(operation)
+                if old:
+                    row(f"{name} {backend} {operation}", old, result)
+        if 'normalize_url' in page and 'normalize_url' in old_page:
+            row(f"{name} normalize_url", old_page['normalize_url'], page['normalize_url'])
+    return lines
+
+
+def _add_page(corpus_dir: str, manifest: Dict[str, Any], name: str, kind: str, url: str, html: str):
+    data = html.encode('utf-8')
+    with gzip.GzipFile(os.path.join(corpus_dir, f"{name}.html.gz"), 'wb', mtime=0) as f:
+        f.write(data)
+    manifest['pages'] = [page for page in manifest['pages'] if page['name'] != name]
+    manifest['pages'].append({
+        'name': name,
+        'kind': kind,
+        'url': url,
+        'source': 'captured',
+        'description': f"Captured {datetime.now(timezone.utc).date().isoformat()}",
+        'size': len(data),
+        'sha256': hashlib.sha256(data).hexdigest(),
+    })
+    logger.info(f"Captured {name} ({len(data)} bytes)")
+
+
+async def capture(corpus_dir: str, codes: List[str]):
+    """Fetch the detail and attachments pages of purchase orders into the corpus and bump its version"""
+    manifest_path = os.path.join(corpus_dir, 'manifest.json')
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    captured = 0
+    async with MercadoPublicoScraper() as scraper:
+        session = await scraper._get_session()
+        for code in codes:
+            slug = re.sub(r'[^A-Za-z0-9]+', '_', code).strip('_').lower()
+            detail_url = f"{scraper.BASE_URL}{scraper.DETAIL_PATH}?codigoOC={code}"
+            html = await scraper.fetch_detail(detail_url)
+            if not html:
+                logger.warning(f"Could not fetch detail page of {code}")
+                continue
+            _add_page(corpus_dir, manifest, f"{slug}_detail", 'detail', detail_url, html)
+            captured += 1
+
+            attachments_url = (await scraper.parse_detail(html))['attachments_url']
+            if attachments_url:
+                html = await scraper._fetch(session, attachments_url)
+                if html:
+                    _add_page(corpus_dir, manifest, f"{slug}_attachments", 'attachments', attachments_url, html)
+                    captured += 1
+
+    if captured:
+        manifest['version'] += 1
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        logger.info(f"Corpus is now version {manifest['version']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='Corpus directory with manifest.json')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per measurement')
+    parser.add_argument('--backend', action='append', dest='backends',
+                        choices=[*PARSERS, STREAM_BACKEND], help='Backend to measure (repeatable; default all)')
+    parser.add_argument('--page', action='append', dest='pages', help='Only this corpus page (repeatable)')
+    parser.add_argument('--chunk-size', type=int, default=64 * 1024, help=f'Chunk size fed to {STREAM_BACKEND}')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two JSON reports')
+    parser.add_argument('--capture', nargs='+', metavar='CODE', help='Add the pages of these purchase orders to the corpus')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path, encoding='utf-8') as f:
+                reports.append(json.load(f))
+        print('\n'.join(compare(*reports)))
+        return
+
+    if args.capture:
+        asyncio.run(capture(args.corpus, args.capture))
+        return
+
+    report = run_benchmarks(
+        args.corpus,
+        args.backends or [*PARSERS, STREAM_BACKEND],
+        repeat=args.repeat,
+        chunk_size=args.chunk_size,
+        names=args.pages
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        logger.info(f"Wrote {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
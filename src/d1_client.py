@@ -4,9 +4,16 @@ Cloudflare D1 API client for database operations.
 
 import aiohttp
 import asyncio
+import json
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timezone
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Callable, List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+
+from .metrics import QueryMetrics
+from .throttling import CircuitBreaker
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +21,10 @@ logger = logging.getLogger(__name__)
 RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
 
 
+class D1QueryError(Exception):
+    """D1 rejected a query (HTTP 4xx or success: false); sending it again will not help"""
+
+
 class D1Client:
     """Client for Cloudflare D1 database operations via REST API"""
 
@@ -25,12 +36,23 @@ class D1Client:
         max_retries: int = 5,
         base_delay: float = 1.0,
         max_delay: float = 60.0,
-        request_timeout: float = 30.0
+        request_timeout: float = 30.0,
+        flush_size: int = 20,
+        flush_interval: float = 5.0,
+        max_attempts: int = 3,
+        retry_base_delay: float = 900.0,
+        retry_max_delay: float = 86400.0,
+        api_base: str = "https://api.cloudflare.com/client/v4",
+        max_in_flight: int = 4,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30.0,
+        on_flush: Optional[Callable[[List[int]], None]] = None
     ):
         self.account_id = account_id
         self.api_token = api_token
         self.database_id = database_id
-        self.base_url = f"https://api.cloudflare.com/client/v4/accounts/{account_id}/d1/database/{database_id}"
+        # api_base can point at a local stand-in (see d1_local.py)
+        self.base_url = f"{api_base.rstrip('/')}/accounts/{account_id}/d1/database/{database_id}"
         self.headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json"
@@ -41,6 +63,42 @@ class D1Client:
         self.request_timeout = request_timeout
         self._session: Optional[aiohttp.ClientSession] = None
 
+        # Up to max_in_flight queries share the session concurrently. Writes
+        # for one scrape id are serialized by a per-id lock (see _ordered)
+        self.max_in_flight = max_in_flight
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._scrape_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+        # Shared by all queries: a Retry-After pauses everyone, and repeated
+        # 429/5xx/timeouts open the circuit until a probe succeeds
+        self.breaker = CircuitBreaker(
+            failure_threshold=breaker_threshold,
+            reset_timeout=breaker_reset,
+            name='D1'
+        )
+
+        # Per-kind latency histograms, retries and bytes; see stats()
+        self.metrics = QueryMetrics()
+
+        # Retry schedule for transiently failed scrapes: attempt n waits
+        # retry_base_delay * 2^(n-1), capped at retry_max_delay
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+        # Write-behind buffer of status transitions, keyed by scrape id so a
+        # later transition for the same scrape replaces an unflushed one
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, List[Tuple[str, list]]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_timer: Optional[asyncio.Task] = None
+        self._background_flushes: set = set()
+        # Scrapes whose buffered writes D1 rejected outright: {scrape_id: error}
+        self.rejected: Dict[int, str] = {}
+        # Called with the scrape ids of every buffered batch once D1 has it
+        self.on_flush = on_flush
+
     async def _get_session(self) -> aiohttp.ClientSession:
         """Get or create a reusable HTTP session"""
         if self._session is None or self._session.closed:
@@ -48,156 +106,358 @@ class D1Client:
         return self._session
 
     async def close(self):
-        """Close the HTTP session"""
-        if self._session and not self._session.closed:
-            await self._session.close()
-            self._session = None
+        """Flush buffered status updates and close the HTTP session"""
+        try:
+            await self.flush()
+        finally:
+            if self._flush_timer:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._session and not self._session.closed:
+                await self._session.close()
+                self._session = None
 
-    async def _execute(self, sql: str, params: list = None) -> Dict[str, Any]:
+    @asynccontextmanager
+    async def _ordered(self, scrape_ids):
+        """
+        Hold the per-scrape locks for `scrape_ids` so writes for the same
+        scrape reach D1 in the order they were issued. Locks are taken in
+        sorted order to avoid deadlocks between overlapping id sets.
+        """
+        locks = []
+        for scrape_id in sorted(set(scrape_ids)):
+            lock = self._scrape_locks.get(scrape_id)
+            if lock is None:
+                lock = asyncio.Lock()
+                self._scrape_locks[scrape_id] = lock
+            locks.append(lock)
+
+        acquired = []
+        try:
+            for lock in locks:
+                await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Query timings per kind, retry/backoff counters, bytes sent/received and rejected writes"""
+        return {**self.metrics.stats(), 'rejected_scrapes': dict(self.rejected)}
+
+    async def _execute(self, sql: str, params: list = None, kind: str = 'query') -> Dict[str, Any]:
         """Execute a SQL query with retry logic for transient errors"""
-        session = await self._get_session()
         payload = {"sql": sql}
         if params:
             payload["params"] = params
+        return (await self._query(payload, kind) or [{}])[0]
+
+    async def execute_batch(
+        self,
+        statements: List[Tuple[str, list]],
+        kind: str = 'batch'
+    ) -> List[Dict[str, Any]]:
+        """
+        Execute several statements in one /query round trip.
+
+        D1 runs a batch as a single transaction and returns one result per
+        statement, in order. `kind` labels the call in stats().
+        """
+        if not statements:
+            return []
+        payload = {
+            "batch": [
+                {"sql": sql, "params": params} if params else {"sql": sql}
+                for sql, params in statements
+            ]
+        }
+        return await self._query(payload, kind)
 
+    async def _query(self, payload: Dict[str, Any], kind: str = 'query') -> List[Dict[str, Any]]:
+        """POST a /query payload and record its wall-clock time under `kind`"""
+        started = time.monotonic()
+        failed = True
+        try:
+            result = await self._send(payload)
+            failed = False
+            return result
+        finally:
+            self.metrics.observe(
+                kind,
+                time.monotonic() - started,
+                statements=len(payload.get('batch') or [payload]),
+                failed=failed
+            )
+
+    async def _send(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        POST a /query payload with retry logic and return its result list.
+
+        Only the HTTP request itself occupies one of the max_in_flight
+        slots; backoff sleeps happen outside it. Every attempt first passes
+        the client-wide circuit breaker, so a Retry-After or an open circuit
+        holds back all queued queries, not just this one.
+        """
+        session = await self._get_session()
         last_error = None
-        
+        # Serialized once so the bytes on the wire can be counted
+        data = json.dumps(payload).encode('utf-8')
+
         for attempt in range(self.max_retries):
+            delay = min(self.base_delay * (2 ** attempt), self.max_delay)
+            reason = None
+            gate_started = time.monotonic()
+            probe = await self.breaker.wait()
             try:
-                async with session.post(
-                    f"{self.base_url}/query",
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=self.request_timeout)
-                ) as response:
-                    
-                    # Check for retryable HTTP errors BEFORE parsing JSON
-                    if response.status in RETRYABLE_STATUS_CODES:
-                        # Respect Retry-After header if present
-                        retry_after = response.headers.get('Retry-After')
-                        if retry_after:
-                            try:
-                                delay = float(retry_after)
-                            except ValueError:
-                                delay = min(self.base_delay * (2 ** attempt), self.max_delay)
-                        else:
-                            delay = min(self.base_delay * (2 ** attempt), self.max_delay)
-                        
-                        logger.warning(
-                            f"D1 API returned {response.status}, retrying in {delay:.1f}s "
-                            f"(attempt {attempt + 1}/{self.max_retries})"
-                        )
-                        await asyncio.sleep(delay)
-                        continue
-                    
-                    # Check for other non-success status codes
-                    if response.status >= 400:
-                        body_preview = (await response.text())[:200]
-                        raise Exception(
-                            f"D1 API error: HTTP {response.status}. Body: {body_preview}"
-                        )
-                    
-                    # Check content type before parsing JSON
-                    content_type = response.headers.get('Content-Type', '')
-                    if 'application/json' not in content_type:
-                        body_preview = (await response.text())[:200]
-                        raise Exception(
-                            f"D1 API returned unexpected content type: {content_type}. "
-                            f"Status: {response.status}. Body: {body_preview}"
-                        )
-                    
-                    result = await response.json()
+                async with self._in_flight:
+                    self.metrics.gate_wait_seconds += time.monotonic() - gate_started
+                    self.metrics.attempts += 1
+                    self.metrics.bytes_sent += len(data)
+                    async with session.post(
+                        f"{self.base_url}/query",
+                        data=data,
+                        timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+                    ) as response:
+                        self.metrics.bytes_received += len(await response.read())
 
-                    if not result.get("success"):
-                        errors = result.get("errors", [])
-                        raise Exception(f"D1 query failed: {errors}")
+                        # Check for retryable HTTP errors BEFORE parsing JSON
+                        if response.status in RETRYABLE_STATUS_CODES:
+                            # Respect Retry-After header if present
+                            retry_after = response.headers.get('Retry-After')
+                            if retry_after:
+                                try:
+                                    delay = float(retry_after)
+                                    self.breaker.pause(delay)
+                                except ValueError:
+                                    pass
 
-                    return result.get("result", [{}])[0]
+                            self.breaker.record_failure()
+                            reason = f"http_{response.status}"
+                            last_error = Exception(f"HTTP {response.status}")
+                            logger.warning(
+                                f"D1 API returned {response.status}, retrying in {delay:.1f}s "
+                                f"(attempt {attempt + 1}/{self.max_retries})"
+                            )
+
+                        else:
+                            # D1 answered, even if with an error: it is not overloaded
+                            self.breaker.record_success()
+                            return await self._parse_response(response)
 
             except aiohttp.ClientError as e:
+                self.breaker.record_failure()
+                reason = 'connection'
                 last_error = e
-                delay = min(self.base_delay * (2 ** attempt), self.max_delay)
                 logger.warning(
                     f"D1 API connection error: {e}, retrying in {delay:.1f}s "
                     f"(attempt {attempt + 1}/{self.max_retries})"
                 )
-                await asyncio.sleep(delay)
-            
+
             except asyncio.TimeoutError:
+                self.breaker.record_failure()
+                reason = 'timeout'
                 last_error = TimeoutError("D1 API request timed out")
-                delay = min(self.base_delay * (2 ** attempt), self.max_delay)
                 logger.warning(
                     f"D1 API timeout, retrying in {delay:.1f}s "
                     f"(attempt {attempt + 1}/{self.max_retries})"
                 )
-                await asyncio.sleep(delay)
+
+            finally:
+                if probe:
+                    self.breaker.release_probe()
+
+            self.metrics.retry(reason, delay)
+            await asyncio.sleep(delay)
 
         # All retries exhausted
         raise Exception(f"D1 API failed after {self.max_retries} attempts: {last_error}")
 
-    async def get_pending_scrapes(self, limit: int = 200) -> List[Dict[str, Any]]:
-        """Get document scrapes that need processing"""
+    @staticmethod
+    async def _parse_response(response: aiohttp.ClientResponse) -> List[Dict[str, Any]]:
+        """Validate a non-retryable /query response and return its result list"""
+        # Check for other non-success status codes
+        if response.status >= 400:
+            body_preview = (await response.text())[:200]
+            raise D1QueryError(
+                f"D1 API error: HTTP {response.status}. Body: {body_preview}"
+            )
+
+        # Check content type before parsing JSON
+        content_type = response.headers.get('Content-Type', '')
+        if 'application/json' not in content_type:
+            body_preview = (await response.text())[:200]
+            raise Exception(
+                f"D1 API returned unexpected content type: {content_type}. "
+                f"Status: {response.status}. Body: {body_preview}"
+            )
+
+        result = await response.json()
+
+        if not result.get("success"):
+            errors = result.get("errors", [])
+            raise D1QueryError(f"D1 query failed: {errors}")
+
+        return result.get("result", [])
+
+    async def claim_scrapes(
+        self,
+        owner: str,
+        limit: int = 200,
+        lease_seconds: float = 6 * 3600,
+        reclaim_owners: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Atomically claim up to `limit` scrapes for `owner` and return them.
+
+        A single UPDATE ... RETURNING moves pending rows to 'scraping' with a
+        lease, so overlapping runs can never claim the same row. Rows left in
+        'scraping' whose lease has expired, or that have no lease and were
+        last touched more than `lease_seconds` ago, are reclaimed by the
+        same statement. Pending work comes first; spare
+        capacity is filled with 'retry' rows whose next_attempt_at is due,
+        earliest first.
+
+        Rows still leased by one of `reclaim_owners` (earlier runs of this
+        scraper that died without releasing them) are taken over right away,
+        ahead of everything else.
+        """
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=lease_seconds)
+        stale_before = now - timedelta(seconds=lease_seconds)
         result = await self._execute(
             """
-            SELECT id, purchase_id, chilecompra_code, detail_url
-            FROM document_scrapes
-            WHERE scrape_status = 'pending'
-            AND scrape_attempts < 3
-            ORDER BY created_at ASC
-            LIMIT ?
+            UPDATE document_scrapes
+            SET scrape_status = 'scraping',
+                lease_owner = ?,
+                lease_expires_at = ?,
+                updated_at = ?
+            WHERE id IN (
+                SELECT id
+                FROM document_scrapes
+                WHERE (
+                    scrape_status = 'pending'
+                    OR (scrape_status = 'retry' AND next_attempt_at <= ?)
+                    OR (
+                        scrape_status = 'scraping'
+                        AND (
+                            (lease_expires_at IS NULL AND (updated_at IS NULL OR updated_at < ?))
+                            OR lease_expires_at < ?
+                            OR lease_owner IN (SELECT value FROM json_each(?))
+                        )
+                    )
+                )
+                AND scrape_attempts < ?
+                ORDER BY
+                    CASE
+                        WHEN scrape_status = 'scraping' THEN 0
+                        WHEN scrape_status = 'retry' THEN 2
+                        ELSE 1
+                    END,
+                    next_attempt_at ASC,
+                    created_at ASC
+                LIMIT ?
+            )
+            RETURNING id, purchase_id, chilecompra_code, detail_url, scrape_attempts
             """,
-            [limit]
+            [
+                owner,
+                expires_at.isoformat(),
+                now.isoformat(),
+                now.isoformat(),
+                stale_before.isoformat(),
+                now.isoformat(),
+                json.dumps(reclaim_owners or []),
+                self.max_attempts,
+                limit
+            ],
+            kind='claim_scrapes'
         )
         return result.get("results", [])
 
-    async def get_scrapes_by_codes(self, codes: List[str]) -> List[Dict[str, Any]]:
-        """Get specific document scrapes by chilecompra code"""
-        placeholders = ",".join(["?" for _ in codes])
+    async def claim_scrapes_by_codes(
+        self,
+        owner: str,
+        codes: List[str],
+        lease_seconds: float = 6 * 3600
+    ) -> List[Dict[str, Any]]:
+        """
+        Claim specific scrapes by chilecompra code (any number of codes) for `owner`.
+
+        Takes the rows in any status with the same lease as claim_scrapes(),
+        except 'scraping' rows another run still holds (by the rules
+        claim_scrapes() uses to reclaim them), so a manual run and a
+        scheduled run never work on the same purchase.
+        """
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=lease_seconds)
         result = await self._execute(
-            f"""
-            SELECT id, purchase_id, chilecompra_code, detail_url
-            FROM document_scrapes
-            WHERE chilecompra_code IN ({placeholders})
+            """
+            UPDATE document_scrapes
+            SET scrape_status = 'scraping',
+                lease_owner = ?,
+                lease_expires_at = ?,
+                updated_at = ?
+            WHERE chilecompra_code IN (SELECT value FROM json_each(?))
+            AND (
+                scrape_status != 'scraping'
+                OR lease_owner IS ?
+                OR (lease_expires_at IS NULL AND (updated_at IS NULL OR updated_at < ?))
+                OR lease_expires_at < ?
+            )
+            RETURNING id, purchase_id, chilecompra_code, detail_url, scrape_attempts
             """,
-            codes
+            [
+                owner,
+                expires_at.isoformat(),
+                now.isoformat(),
+                json.dumps(codes),
+                owner,
+                (now - timedelta(seconds=lease_seconds)).isoformat(),
+                now.isoformat()
+            ],
+            kind='claim_scrapes'
         )
         return result.get("results", [])
 
-    async def update_status(self, scrape_ids: List[int], status: str):
-        """Update scrape_status for multiple document scrapes (batched to avoid SQL variable limits)"""
-        # SQLite has a limit of ~999 variables, so we batch in chunks of 50
-        BATCH_SIZE = 50
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        for i in range(0, len(scrape_ids), BATCH_SIZE):
-            batch = scrape_ids[i:i + BATCH_SIZE]
-            placeholders = ",".join(["?" for _ in batch])
-            await self._execute(
-                f"""
-                UPDATE document_scrapes
-                SET scrape_status = ?,
-                    updated_at = ?
-                WHERE id IN ({placeholders})
-                """,
-                [status, timestamp] + batch
-            )
+    async def release_leases(self, owner: str):
+        """Return scrapes still leased by `owner` and not finished to 'pending'"""
+        await self._execute(
+            """
+            UPDATE document_scrapes
+            SET scrape_status = 'pending',
+                lease_owner = NULL,
+                lease_expires_at = NULL,
+                updated_at = ?
+            WHERE lease_owner = ?
+            AND scrape_status = 'scraping'
+            """,
+            [datetime.now(timezone.utc).isoformat(), owner],
+            kind='release_leases'
+        )
 
-    async def update_scrape_success(
-        self,
+    @staticmethod
+    def _success_statement(
         scrape_id: int,
         r2_folder: str,
         attachment_count: int,
         total_file_size: int,
-        pdf_report_url: Optional[str] = None
-    ):
-        """Mark document scrape as successfully completed"""
-        await self._execute(
+        pdf_report_url: Optional[str] = None,
+        attachments_url: Optional[str] = None
+    ) -> Tuple[str, list]:
+        timestamp = datetime.now(timezone.utc).isoformat()
+        return (
             """
             UPDATE document_scrapes
             SET scrape_status = 'scraped',
+                next_attempt_at = NULL,
+                lease_owner = NULL,
+                lease_expires_at = NULL,
                 r2_folder = ?,
                 attachment_count = ?,
                 total_file_size = ?,
                 pdf_report_url = ?,
+                attachments_url = ?,
                 last_scrape_at = ?,
                 updated_at = ?
             WHERE id = ?
@@ -207,18 +467,77 @@ class D1Client:
                 attachment_count,
                 total_file_size,
                 pdf_report_url,
-                datetime.now(timezone.utc).isoformat(),
-                datetime.now(timezone.utc).isoformat(),
+                attachments_url,
+                timestamp,
+                timestamp,
                 scrape_id
             ]
         )
 
-    async def update_scrape_failed(self, scrape_id: int, error: str):
-        """Mark document scrape as failed"""
-        await self._execute(
+    @staticmethod
+    def _attachment_statement(
+        document_scrape_id: int,
+        filename: str,
+        file_type: Optional[str],
+        r2_key: Optional[str],
+        file_size: Optional[int],
+        content_type: Optional[str] = None,
+        download_status: str = 'downloaded',
+        download_error: Optional[str] = None
+    ) -> Tuple[str, list]:
+        # A 'failed' row has no r2_key yet; repair mode downloads it later
+        return (
+            """
+            INSERT INTO attachments (
+                document_scrape_id, filename, file_type, r2_key, file_size, content_type,
+                download_status, download_attempts, download_error, updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?)
+            """,
+            [
+                document_scrape_id,
+                filename,
+                file_type,
+                r2_key,
+                file_size,
+                content_type,
+                download_status,
+                download_error[:500] if download_error else None,
+                datetime.now(timezone.utc).isoformat()
+            ]
+        )
+
+    def _failure_statement(
+        self,
+        scrape_id: int,
+        error: str,
+        attempts: int = 0,
+        transient: bool = True
+    ) -> Tuple[str, list]:
+        """
+        Record a failed attempt.
+
+        `attempts` is the scrape_attempts value before this failure. Transient
+        failures with attempts left go to 'retry' with an exponential
+        next_attempt_at; permanent ones and exhausted retries go to 'failed'.
+        """
+        now = datetime.now(timezone.utc)
+        attempts += 1
+        if transient and attempts < self.max_attempts:
+            status = 'retry'
+            delay = min(self.retry_base_delay * (2 ** (attempts - 1)), self.retry_max_delay)
+            next_attempt_at = (now + timedelta(seconds=delay)).isoformat()
+        else:
+            status = 'failed'
+            next_attempt_at = None
+
+        return (
             """
             UPDATE document_scrapes
-            SET scrape_status = 'failed',
+            SET scrape_status = ?,
+                next_attempt_at = ?,
+                lease_owner = NULL,
+                lease_expires_at = NULL,
                 scrape_error = ?,
                 scrape_attempts = scrape_attempts + 1,
                 last_scrape_at = ?,
@@ -226,27 +545,263 @@ class D1Client:
             WHERE id = ?
             """,
             [
+                status,
+                next_attempt_at,
                 error[:500],  # Truncate long errors
-                datetime.now(timezone.utc).isoformat(),
-                datetime.now(timezone.utc).isoformat(),
+                now.isoformat(),
+                now.isoformat(),
                 scrape_id
             ]
         )
 
-    async def insert_attachment(
-        self,
-        document_scrape_id: int,
-        filename: str,
-        file_type: Optional[str],
-        r2_key: str,
-        file_size: int,
-        content_type: Optional[str] = None
-    ):
-        """Insert an attachment record"""
-        await self._execute(
+    def _commit_statements(self, commit: Dict[str, Any]) -> List[Tuple[str, list]]:
+        """Attachment inserts followed by the success update for one commit dict"""
+        statements = [
+            self._attachment_statement(document_scrape_id=commit['scrape_id'], **attachment)
+            for attachment in commit.get('attachments', [])
+        ]
+        statements.append(self._success_statement(
+            scrape_id=commit['scrape_id'],
+            r2_folder=commit['r2_folder'],
+            attachment_count=commit['attachment_count'],
+            total_file_size=commit['total_file_size'],
+            pdf_report_url=commit.get('pdf_report_url'),
+            attachments_url=commit.get('attachments_url')
+        ))
+        return statements
+
+    async def get_failed_attachments(self, limit: int = 200) -> List[Dict[str, Any]]:
+        """
+        Failed attachment downloads with attempts left, for up to `limit` scrapes.
+
+        Each row carries its scrape's chilecompra_code and stored
+        attachments_url, so repair needs no detail page request.
+        """
+        result = await self._execute(
             """
-            INSERT INTO attachments (document_scrape_id, filename, file_type, r2_key, file_size, content_type)
-            VALUES (?, ?, ?, ?, ?, ?)
+            SELECT a.id, a.document_scrape_id, a.filename, a.file_type, a.download_attempts,
+                   d.chilecompra_code, d.attachments_url
+            FROM attachments a
+            JOIN document_scrapes d ON d.id = a.document_scrape_id
+            WHERE a.download_status = 'failed'
+            AND a.download_attempts < ?
+            AND a.document_scrape_id IN (
+                SELECT DISTINCT a2.document_scrape_id
+                FROM attachments a2
+                JOIN document_scrapes d2 ON d2.id = a2.document_scrape_id
+                WHERE a2.download_status = 'failed'
+                AND a2.download_attempts < ?
+                AND d2.attachments_url IS NOT NULL
+                ORDER BY a2.document_scrape_id
+                LIMIT ?
+            )
+            ORDER BY a.document_scrape_id, a.id
             """,
-            [document_scrape_id, filename, file_type, r2_key, file_size, content_type]
+            [self.max_attempts, self.max_attempts, limit],
+            kind='get_failed_attachments'
         )
+        return result.get("results", [])
+
+    async def commit_attachment_repairs(
+        self,
+        scrape_id: int,
+        repaired: List[Dict[str, Any]],
+        failed: List[Dict[str, Any]]
+    ):
+        """
+        Record one scrape's repair attempt in a single round trip.
+
+        `repaired` holds dicts with the attachment 'id', 'r2_key', 'file_size'
+        and 'content_type'; `failed` holds dicts with 'id' and 'error'. The
+        scrape's attachment_count and total_file_size grow by the repaired files.
+        """
+        timestamp = datetime.now(timezone.utc).isoformat()
+        statements = [
+            (
+                """
+                UPDATE attachments
+                SET download_status = 'downloaded',
+                    download_attempts = download_attempts + 1,
+                    download_error = NULL,
+                    r2_key = ?,
+                    file_size = ?,
+                    content_type = ?,
+                    updated_at = ?
+                WHERE id = ?
+                """,
+                [
+                    attachment['r2_key'],
+                    attachment['file_size'],
+                    attachment.get('content_type'),
+                    timestamp,
+                    attachment['id']
+                ]
+            )
+            for attachment in repaired
+        ]
+        statements.extend(
+            (
+                """
+                UPDATE attachments
+                SET download_attempts = download_attempts + 1,
+                    download_error = ?,
+                    updated_at = ?
+                WHERE id = ?
+                """,
+                [attachment['error'][:500], timestamp, attachment['id']]
+            )
+            for attachment in failed
+        )
+        if repaired:
+            statements.append((
+                """
+                UPDATE document_scrapes
+                SET attachment_count = COALESCE(attachment_count, 0) + ?,
+                    total_file_size = COALESCE(total_file_size, 0) + ?,
+                    updated_at = ?
+                WHERE id = ?
+                """,
+                [
+                    len(repaired),
+                    sum(attachment['file_size'] or 0 for attachment in repaired),
+                    timestamp,
+                    scrape_id
+                ]
+            ))
+        if not statements:
+            return
+
+        async with self._ordered([scrape_id]):
+            await self.execute_batch(statements, kind='commit_attachment_repairs')
+
+    async def queue_commit(self, commit: Dict[str, Any]):
+        """
+        Buffer a successful scrape for a later flush.
+
+        `commit` is a dict with 'scrape_id' and the _success_statement
+        arguments plus 'attachments', a list of dicts with the
+        _attachment_statement arguments (without document_scrape_id),
+        including failed downloads with download_status='failed'.
+        Attachment rows are separate statements rather than one multi-row
+        INSERT because D1 caps bound parameters per statement at 100.
+
+        Returns without a D1 round trip unless the buffer is far behind
+        (D1 slow or failing), in which case it waits for a flush. Once this
+        returns the commit is accepted: flush errors never reach the caller.
+        """
+        await self._enqueue(commit['scrape_id'], self._commit_statements(commit))
+
+    async def queue_failure(
+        self,
+        scrape_id: int,
+        error: str,
+        attempts: int = 0,
+        transient: bool = True
+    ):
+        """Buffer a failed scrape (see _failure_statement) for a later flush"""
+        await self._enqueue(
+            scrape_id,
+            [self._failure_statement(scrape_id, error, attempts, transient)]
+        )
+
+    async def _enqueue(self, scrape_id: int, statements: List[Tuple[str, list]]):
+        self._pending.pop(scrape_id, None)
+        self._pending[scrape_id] = statements
+
+        if self._flush_timer is None or self._flush_timer.done():
+            self._flush_timer = asyncio.create_task(self._flush_periodically())
+
+        if len(self._pending) >= self.flush_size * 4:
+            # Backpressure: do not let the buffer grow without bound. The
+            # entries are already queued, so a failed flush keeps them for
+            # the next one instead of failing the caller's write
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"D1 flush under backpressure failed, will retry: {e}")
+        elif len(self._pending) >= self.flush_size:
+            task = asyncio.create_task(self._flush_in_background())
+            self._background_flushes.add(task)
+            task.add_done_callback(self._background_flushes.discard)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush_in_background()
+
+    async def _flush_in_background(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Background D1 flush failed, will retry: {e}")
+
+    async def flush(self):
+        """
+        Write all buffered status transitions to D1.
+
+        The buffer is split into requests of flush_size scrapes that run
+        concurrently within max_in_flight. Each scrape id appears in only
+        one request, and flushes themselves are serialized, so per-scrape
+        ordering is preserved.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            scrape_ids = list(pending)
+            chunks = [
+                {scrape_id: pending[scrape_id] for scrape_id in scrape_ids[i:i + self.flush_size]}
+                for i in range(0, len(scrape_ids), self.flush_size)
+            ]
+
+            results = await asyncio.gather(
+                *(self._flush_chunk(chunk) for chunk in chunks),
+                return_exceptions=True
+            )
+
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                raise errors[0]
+
+    async def _flush_chunk(self, batch: Dict[int, List[Tuple[str, list]]]):
+        """
+        Write one chunk of buffered transitions in a single batch.
+
+        A batch is one transaction, so a single statement D1 rejects fails
+        the whole chunk; the chunk is then written scrape by scrape and only
+        the scrapes D1 still rejects are dropped (see `rejected`). Transient
+        failures put the chunk back into the buffer for the next flush.
+        """
+        try:
+            async with self._ordered(batch):
+                await self.execute_batch(
+                    [
+                        statement
+                        for statements in batch.values()
+                        for statement in statements
+                    ],
+                    kind='flush'
+                )
+        except D1QueryError as e:
+            if len(batch) == 1:
+                scrape_id = next(iter(batch))
+                self.rejected[scrape_id] = str(e)
+                logger.error(f"D1 rejected the buffered writes of scrape {scrape_id}, dropping them: {e}")
+                return
+            logger.warning(f"D1 rejected a flush of {len(batch)} scrapes, writing them one by one: {e}")
+            results = await asyncio.gather(
+                *(self._flush_chunk({scrape_id: statements}) for scrape_id, statements in batch.items()),
+                return_exceptions=True
+            )
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                raise errors[0]
+            return
+        except BaseException:
+            # Put the batch back unless a newer transition replaced it
+            for scrape_id, statements in batch.items():
+                self._pending.setdefault(scrape_id, statements)
+            raise
+        logger.debug(f"Flushed {len(batch)} buffered D1 status updates")
+        if self.on_flush:
+            self.on_flush(list(batch))
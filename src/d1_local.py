@@ -0,0 +1,303 @@
+"""
+Local stand-in for the Cloudflare D1 REST /query endpoint, backed by SQLite.
+
+Serves the same request and response envelope as
+api.cloudflare.com/client/v4/accounts/{account}/d1/database/{db}/query,
+with configurable latency and injected 429/5xx responses, so the
+orchestrator's D1 overhead and retry behaviour can be measured offline.
+
+Run standalone:
+
+    python -m src.d1_local --port 8787 --seed 200 --latency 0.1-0.3 --throttle-rate 0.05
+
+then point the scraper at it with D1_API_BASE=http://127.0.0.1:8787/client/v4.
+Or use it in-process:
+
+    async with LocalD1Server(latency=(0.1, 0.3)) as server:
+        client = D1Client(account_id, token, database_id, api_base=server.api_base)
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Columns the scraper reads and writes; mirrors the website's Drizzle schema
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS document_scrapes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    purchase_id INTEGER,
+    chilecompra_code TEXT NOT NULL,
+    detail_url TEXT NOT NULL,
+    scrape_status TEXT NOT NULL DEFAULT 'pending',
+    scrape_attempts INTEGER NOT NULL DEFAULT 0,
+    scrape_error TEXT,
+    r2_folder TEXT,
+    attachment_count INTEGER,
+    total_file_size INTEGER,
+    pdf_report_url TEXT,
+    attachments_url TEXT,
+    last_scrape_at TEXT,
+    next_attempt_at TEXT,
+    lease_owner TEXT,
+    lease_expires_at TEXT,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS attachments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    document_scrape_id INTEGER NOT NULL REFERENCES document_scrapes(id),
+    filename TEXT NOT NULL,
+    file_type TEXT,
+    r2_key TEXT,
+    file_size INTEGER,
+    content_type TEXT,
+    download_status TEXT NOT NULL DEFAULT 'downloaded',
+    download_attempts INTEGER NOT NULL DEFAULT 1,
+    download_error TEXT,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    updated_at TEXT
+);
+"""
+
+DETAIL_URL_TEMPLATE = (
+    "https://www.mercadopublico.cl/PurchaseOrder/Modules/PO/DetailsPurchaseOrder.aspx?codigoOC={code}"
+)
+
+
+class LocalD1Server:
+    """aiohttp server that answers D1 /query requests from a SQLite database"""
+
+    def __init__(
+        self,
+        db_path: str = ':memory:',
+        host: str = '127.0.0.1',
+        port: int = 0,
+        latency: Tuple[float, float] = (0.0, 0.0),
+        throttle_rate: float = 0.0,
+        error_rate: float = 0.0,
+        retry_after: Optional[float] = None,
+        seed: Optional[int] = None
+    ):
+        self.db_path = db_path
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+        self.stats = {
+            'requests': 0,
+            'statements': 0,
+            'throttled': 0,
+            'server_errors': 0,
+            'query_errors': 0,
+        }
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def api_base(self) -> str:
+        """Value for D1Client(api_base=...) / D1_API_BASE"""
+        return f"http://{self.host}:{self.port}/client/v4"
+
+    def seed_scrapes(self, count: int, prefix: str = 'LOCAL'):
+        """Insert `count` pending document scrapes with fake chilecompra codes"""
+        rows = []
+        for i in range(1, count + 1):
+            code = f"{prefix}-{i}-AG25"
+            rows.append((i, code, DETAIL_URL_TEMPLATE.format(code=code)))
+        self.db.executemany(
+            "INSERT INTO document_scrapes (purchase_id, chilecompra_code, detail_url) VALUES (?, ?, ?)",
+            rows
+        )
+        self.db.commit()
+
+    def _app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post(
+            '/client/v4/accounts/{account_id}/d1/database/{database_id}/query',
+            self._handle_query
+        )
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self._app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Resolve the real port when started with port=0
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"Local D1 listening on {self.api_base}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        self.db.close()
+
+    async def __aenter__(self) -> 'LocalD1Server':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def _error(self, status: int, message: str, code: int = 7500) -> web.Response:
+        return web.json_response(
+            {
+                'result': [],
+                'success': False,
+                'errors': [{'code': code, 'message': message}],
+                'messages': []
+            },
+            status=status
+        )
+
+    def _injected_fault(self) -> Optional[web.Response]:
+        """Maybe answer with a simulated 429 or 5xx instead of running the query"""
+        roll = self.random.random()
+        headers = {}
+        if self.retry_after is not None:
+            headers['Retry-After'] = f"{self.retry_after:g}"
+
+        if roll < self.throttle_rate:
+            self.stats['throttled'] += 1
+            response = self._error(429, 'Too many requests', code=971)
+            response.headers.update(headers)
+            return response
+
+        if roll < self.throttle_rate + self.error_rate:
+            self.stats['server_errors'] += 1
+            status = self.random.choice([500, 502, 503])
+            response = self._error(status, 'Internal error', code=7500)
+            response.headers.update(headers)
+            return response
+
+        return None
+
+    def _run_statements(self, statements: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run statements in one transaction, like a D1 batch"""
+        results = []
+        try:
+            for statement in statements:
+                started = time.perf_counter()
+                before = self.db.total_changes
+                cursor = self.db.execute(statement['sql'], statement.get('params') or [])
+                rows = [dict(row) for row in cursor.fetchall()]
+                changes = self.db.total_changes - before
+                results.append({
+                    'results': rows,
+                    'success': True,
+                    'meta': {
+                        'changed_db': changes > 0,
+                        'changes': changes,
+                        'duration': round((time.perf_counter() - started) * 1000, 3),
+                        'last_row_id': (cursor.lastrowid or 0) if changes else 0,
+                        'rows_read': len(rows),
+                        'rows_written': changes,
+                    }
+                })
+                self.stats['statements'] += 1
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return results
+
+    async def _handle_query(self, request: web.Request) -> web.Response:
+        self.stats['requests'] += 1
+
+        if self.latency[1] > 0:
+            await asyncio.sleep(self.random.uniform(*self.latency))
+
+        fault = self._injected_fault()
+        if fault is not None:
+            return fault
+
+        try:
+            payload = await request.json()
+        except ValueError:
+            return self._error(400, 'Request body is not valid JSON')
+
+        statements = payload.get('batch') or [payload]
+        if any('sql' not in statement for statement in statements):
+            return self._error(400, "Missing 'sql'")
+
+        try:
+            results = self._run_statements(statements)
+        except sqlite3.Error as e:
+            self.stats['query_errors'] += 1
+            return self._error(400, f"{e}: SQLITE_ERROR")
+
+        return web.json_response({
+            'result': results,
+            'success': True,
+            'errors': [],
+            'messages': []
+        })
+
+
+def _parse_range(value: str) -> Tuple[float, float]:
+    """Parse '0.1' or '0.1-0.3' into a (min, max) latency range"""
+    if '-' in value:
+        low, high = value.split('-', 1)
+        return float(low), float(high)
+    return float(value), float(value)
+
+
+async def _serve(args: argparse.Namespace):
+    server = LocalD1Server(
+        db_path=args.db,
+        host=args.host,
+        port=args.port,
+        latency=_parse_range(args.latency),
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        seed=args.random_seed
+    )
+    if args.seed:
+        server.seed_scrapes(args.seed)
+
+    async with server:
+        try:
+            await asyncio.Event().wait()
+        finally:
+            logger.info(f"Local D1 stats: {server.stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', default=':memory:', help='SQLite database path')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--latency', default='0', help="Seconds per request, e.g. '0.1' or '0.1-0.3'")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 5xx')
+    parser.add_argument('--retry-after', type=float, default=None, help='Retry-After seconds on injected faults')
+    parser.add_argument('--seed', type=int, default=0, help='Insert this many pending document scrapes')
+    parser.add_argument('--random-seed', type=int, default=None, help='Seed for latency and fault injection')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Append-only progress journal so an interrupted run can resume mid-batch.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """
+    JSON-lines journal of completed stages per chilecompra code.
+
+    Events, one per line:
+        run        a run started; records its lease owner
+        file       one file was uploaded to R2 (key, filename, size, ...)
+        uploaded   all files and metadata are in R2; holds the D1 commit dict
+        committed  the scrape's outcome was written to D1
+
+    Every record is flushed and fsynced before record() returns, so the
+    journal survives the process being killed. A truncated last line (a
+    crash mid-write) is ignored on load. If `r2` and `r2_key` are given the
+    file is also mirrored to R2 every `sync_interval` seconds.
+
+    Each code remembers the run (lease owner) that last worked on it.
+    Unfinished codes idle for more than `max_age` seconds are dropped when
+    the journal is reopened: by then their lease has expired and another
+    run may have finished them.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        r2=None,
+        r2_key: Optional[str] = None,
+        sync_interval: float = 60.0,
+        max_age: Optional[float] = None
+    ):
+        self.path = path
+        self.r2 = r2
+        self.r2_key = r2_key
+        self.sync_interval = sync_interval
+        self.max_age = max_age
+
+        # code -> {'scrape_id', 'owner', 'at', 'files': {key: record},
+        #          'uploaded': commit or None, 'committed': bool}
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self.owners: List[str] = []
+
+        self.owner: Optional[str] = None
+        self._file = None
+        self._sync_task: Optional[asyncio.Task] = None
+
+    async def restore(self):
+        """Fetch the journal from R2 if there is no local copy (e.g. a new runner)"""
+        if os.path.exists(self.path) or not (self.r2 and self.r2_key):
+            return
+        data = await self.r2.download_bytes(self.r2_key)
+        if data:
+            with open(self.path, 'wb') as f:
+                f.write(data)
+            logger.info(f"Restored journal from R2: {self.r2_key} ({len(data)} bytes)")
+
+    def load(self):
+        """Replay the journal file into `state` and `owners`"""
+        self.state = {}
+        self.owners = []
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping unreadable journal line in {self.path}")
+                    continue
+                self._apply(record)
+
+        unfinished = len(self.unfinished())
+        logger.info(f"Loaded journal {self.path}: {len(self.state)} codes, {unfinished} unfinished")
+
+    def _apply(self, record: Dict[str, Any]):
+        event = record.get('event')
+        if event == 'run':
+            self.owners.append(record['owner'])
+            return
+
+        entry = self.state.setdefault(record['code'], {
+            'scrape_id': record.get('scrape_id'),
+            'files': {},
+            'uploaded': None,
+            'committed': False
+        })
+        # Older records carry no owner; they belong to the run logged before them
+        entry['owner'] = record.get('owner') or (self.owners[-1] if self.owners else None)
+        entry['at'] = record.get('at')
+        if event == 'file':
+            entry['files'][record['key']] = record
+        elif event == 'uploaded':
+            entry['uploaded'] = record['commit']
+        elif event == 'committed':
+            entry['committed'] = True
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        if self.max_age is None or not entry.get('at'):
+            return False
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(entry['at'])
+        return age.total_seconds() > self.max_age
+
+    def unfinished(self) -> Dict[str, Dict[str, Any]]:
+        """Codes with journaled progress whose outcome never reached D1"""
+        return {code: entry for code, entry in self.state.items() if not entry['committed']}
+
+    def open(self, owner: str, keep_unfinished: bool = True):
+        """
+        Start journaling for a run.
+
+        The file is rewritten first: with `keep_unfinished` it keeps only the
+        unfinished codes younger than `max_age` (and the owners that may
+        still lease them), otherwise it starts empty.
+        """
+        records = []
+        if keep_unfinished:
+            unfinished = {
+                code: entry for code, entry in self.unfinished().items()
+                if not self._expired(entry)
+            }
+            dropped = len(self.unfinished()) - len(unfinished)
+            if dropped:
+                logger.info(f"Dropped {dropped} journal entries idle for more than {self.max_age:.0f}s")
+
+            owners = list(dict.fromkeys(entry['owner'] for entry in unfinished.values() if entry['owner']))
+            records.extend({'event': 'run', 'owner': previous} for previous in owners)
+            for code, entry in unfinished.items():
+                records.extend({**record, 'owner': entry['owner']} for record in entry['files'].values())
+                if entry['uploaded'] is not None:
+                    records.append({
+                        'event': 'uploaded',
+                        'at': entry['at'],
+                        'owner': entry['owner'],
+                        'code': code,
+                        'scrape_id': entry['scrape_id'],
+                        'commit': entry['uploaded']
+                    })
+            self.state = unfinished
+            self.owners = owners
+        else:
+            self.state = {}
+            self.owners = []
+
+        # Compact through a temp file so a crash never leaves half a journal
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self.owner = owner
+        self.record('run', owner=owner)
+
+        if self.r2 and self.r2_key and self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_periodically())
+
+    def record(self, event: str, code: Optional[str] = None, **fields):
+        """Append one event and make it durable before returning"""
+        record = {'event': event, 'at': datetime.now(timezone.utc).isoformat(), **fields}
+        if code is not None:
+            record['code'] = code
+            record['owner'] = self.owner
+        if self._file is None:
+            raise RuntimeError("Journal is not open")
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._apply(record)
+
+    def files(self, code: str) -> Dict[str, Dict[str, Any]]:
+        """Journaled file uploads for a code, keyed by R2 key"""
+        entry = self.state.get(code)
+        return dict(entry['files']) if entry else {}
+
+    def uploaded(self, code: str) -> Optional[Dict[str, Any]]:
+        """The D1 commit dict of a code whose uploads all finished, if any"""
+        entry = self.state.get(code)
+        return entry['uploaded'] if entry else None
+
+    async def sync(self):
+        """Upload the journal to R2 (no-op without an R2 key)"""
+        if not (self.r2 and self.r2_key) or not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        await self.r2.upload_bytes(self.r2_key, data, 'application/x-ndjson')
+
+    async def _sync_periodically(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"Journal sync to R2 failed: {e}")
+
+    async def close(self):
+        """Stop the periodic sync, do a final sync and close the file"""
+        if self._sync_task:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        try:
+            await self.sync()
+        except Exception as e:
+            # The local file is complete; only the R2 copy is stale
+            logger.warning(f"Final journal sync to R2 failed: {e}")
+        finally:
+            if self._file:
+                self._file.close()
+                self._file = None
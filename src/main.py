@@ -7,11 +7,16 @@ import asyncio
 import logging
 import os
 import json
+import signal
+import socket
 import sys
+import uuid
 from datetime import datetime, timezone
 
-from .mercadopublico import MercadoPublicoScraper
+from .mercadopublico import MercadoPublicoScraper, ScrapeError, file_size
+from .pipeline import Pipeline, Stage
 from .d1_client import D1Client
+from .journal import Journal
 from .r2_client import R2Client
 
 # Configure logging
@@ -31,27 +36,97 @@ class ScraperOrchestrator:
         # Load configuration from environment
         self.batch_size = int(os.environ.get('BATCH_SIZE', 200))
         self.dry_run = os.environ.get('DRY_RUN', 'false').lower() == 'true'
+        self.lease_seconds = float(os.environ.get('LEASE_SECONDS', 6 * 3600))
+        # Identifies this run's leases in D1; unique even for reruns of one workflow run
+        self.lease_owner = (
+            f"{os.environ.get('GITHUB_RUN_ID') or socket.gethostname()}-"
+            f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        )
         self.max_concurrent = int(os.environ.get('MAX_CONCURRENT', 5))
+        self.max_concurrency_limit = int(os.environ.get('MAX_CONCURRENCY_LIMIT', 0))
         self.delay_min = float(os.environ.get('DELAY_MIN', 1.5))
         self.delay_max = float(os.environ.get('DELAY_MAX', 3.0))
+        rps = os.environ.get('REQUESTS_PER_SECOND')
+        self.requests_per_second = float(rps) if rps else None
+        self.rate_burst = int(os.environ.get('RATE_BURST', 1))
+        self.purchase_workers = int(os.environ.get('PURCHASE_WORKERS', self.max_concurrent))
+        self.limit_per_host = int(os.environ.get('LIMIT_PER_HOST', 0))
+        self.dns_ttl = int(os.environ.get('DNS_TTL', 300))
+        self.r2_workers = int(os.environ.get('R2_WORKERS', 8))
+        self.spool_max_memory = int(os.environ.get('SPOOL_MAX_MEMORY', 1024 * 1024))
+        self.spool_dir = os.environ.get('SPOOL_DIR') or None
+
+        # Pipeline stage worker counts and queue depth
+        self.stage_workers = {
+            'fetch': int(os.environ.get('FETCH_WORKERS', self.purchase_workers)),
+            'parse': int(os.environ.get('PARSE_WORKERS', 1)),
+            'download': int(os.environ.get('DOWNLOAD_WORKERS', self.purchase_workers)),
+            'upload': int(os.environ.get('UPLOAD_WORKERS', 4)),
+            'commit': int(os.environ.get('COMMIT_WORKERS', 2)),
+        }
+        self.queue_depth = int(os.environ.get('STAGE_QUEUE_DEPTH', 10))
+
+        # Progress journal for resuming an interrupted run
+        self.resume = os.environ.get('RESUME', 'false').lower() == 'true'
+        self.journal_path = os.environ.get('JOURNAL_PATH', 'scraper_journal.jsonl')
 
         # Initialize clients
         self.d1 = D1Client(
             account_id=os.environ['CF_ACCOUNT_ID'],
             api_token=os.environ['CF_API_TOKEN'],
-            database_id=os.environ['D1_DATABASE_ID']
+            database_id=os.environ['D1_DATABASE_ID'],
+            flush_size=int(os.environ.get('D1_FLUSH_SIZE', 20)),
+            flush_interval=float(os.environ.get('D1_FLUSH_INTERVAL', 5.0)),
+            max_attempts=int(os.environ.get('MAX_SCRAPE_ATTEMPTS', 3)),
+            retry_base_delay=float(os.environ.get('RETRY_BASE_DELAY', 900)),
+            retry_max_delay=float(os.environ.get('RETRY_MAX_DELAY', 86400)),
+            api_base=os.environ.get('D1_API_BASE', 'https://api.cloudflare.com/client/v4'),
+            max_in_flight=int(os.environ.get('D1_MAX_IN_FLIGHT', 4)),
+            breaker_threshold=int(os.environ.get('D1_BREAKER_THRESHOLD', 5)),
+            breaker_reset=float(os.environ.get('D1_BREAKER_RESET', 30.0)),
+            on_flush=self._on_d1_flush
         )
 
         self.r2 = R2Client(
             account_id=os.environ['CF_ACCOUNT_ID'],
             access_key=os.environ['R2_ACCESS_KEY'],
             secret_key=os.environ['R2_SECRET_KEY'],
-            bucket=os.environ['R2_BUCKET']
+            bucket=os.environ['R2_BUCKET'],
+            max_workers=self.r2_workers,
+            multipart_threshold=int(os.environ.get('R2_MULTIPART_THRESHOLD', 16 * 1024 * 1024)),
+            part_size=int(os.environ.get('R2_PART_SIZE', 8 * 1024 * 1024)),
+            part_concurrency=int(os.environ.get('R2_PART_CONCURRENCY', 4))
         )
 
+        # Dry runs upload nothing, so there is nothing to journal
+        self.journal = None
+        if not self.dry_run:
+            self.journal = Journal(
+                self.journal_path,
+                r2=self.r2,
+                r2_key=os.environ.get('JOURNAL_R2_KEY') or None,
+                sync_interval=float(os.environ.get('JOURNAL_SYNC_INTERVAL', 60)),
+                # Past the lease, another run may have finished the code
+                max_age=self.lease_seconds
+            )
+        self._codes_by_id = {}
+
         self.scraper = MercadoPublicoScraper(
             max_concurrent=self.max_concurrent,
-            delay_range=(self.delay_min, self.delay_max)
+            delay_range=(self.delay_min, self.delay_max),
+            limit_per_host=self.limit_per_host,
+            dns_ttl=self.dns_ttl,
+            requests_per_second=self.requests_per_second,
+            burst=self.rate_burst,
+            max_concurrency_limit=self.max_concurrency_limit,
+            spool_max_memory=self.spool_max_memory,
+            spool_dir=self.spool_dir,
+            parser_backend=os.environ.get('PARSER_BACKEND', 'lxml'),
+            parser_verify_rate=float(os.environ.get('PARSER_VERIFY_RATE', 0.0)),
+            stream_detail=os.environ.get('STREAM_DETAIL_PARSE', 'false').lower() == 'true',
+            parse_pool=os.environ.get('PARSE_POOL', 'none'),
+            parse_pool_size=int(os.environ.get('PARSE_POOL_SIZE', 0)),
+            parse_offload_threshold=int(os.environ.get('PARSE_OFFLOAD_THRESHOLD', 64 * 1024))
         )
 
         # Stats tracking
@@ -62,19 +137,52 @@ class ScraperOrchestrator:
             'succeeded': 0,
             'failed': 0,
             'files_uploaded': 0,
-            'total_bytes': 0
+            'total_bytes': 0,
+            'attachments_failed': 0,
+            'attachments_repaired': 0,
+            'stage_workers': self.stage_workers,
+            'resumed': 0
         }
+        self._stats_lock = asyncio.Lock()
 
     async def run(self, test_ids: list = None):
         """Main execution flow"""
-        logger.info(f"Starting scraper (batch_size={self.batch_size}, dry_run={self.dry_run})")
+        logger.info(
+            f"Starting scraper (batch_size={self.batch_size}, dry_run={self.dry_run}, "
+            f"stages={self.stage_workers})"
+        )
 
+        claimed = False
         try:
-            # Step 1: Get pending scrapes from D1
+            # Step 0: Pick up the journal of an interrupted run (or start a new one)
+            if self.journal:
+                if self.resume:
+                    await self.journal.restore()
+                    self.journal.load()
+                self.journal.open(self.lease_owner, keep_unfinished=self.resume)
+
+            # Steps 1-2: Claim pending scrapes (or the requested codes) as "scraping"
+            claimed = True
             if test_ids:
-                scrapes = await self.d1.get_scrapes_by_codes(test_ids)
+                scrapes = await self.d1.claim_scrapes_by_codes(
+                    owner=self.lease_owner,
+                    codes=test_ids,
+                    lease_seconds=self.lease_seconds
+                )
+                if len(scrapes) < len(set(test_ids)):
+                    logger.warning(
+                        f"Claimed {len(scrapes)} of {len(set(test_ids))} requested codes; "
+                        "the rest are unknown or leased by another run"
+                    )
             else:
-                scrapes = await self.d1.get_pending_scrapes(limit=self.batch_size)
+                scrapes = await self.d1.claim_scrapes(
+                    owner=self.lease_owner,
+                    limit=self.batch_size,
+                    lease_seconds=self.lease_seconds,
+                    # Take back rows an interrupted run still holds
+                    reclaim_owners=self.journal.owners[:-1] if self.journal and self.resume else None
+                )
+                logger.info(f"Claimed scrapes with lease owner {self.lease_owner}")
 
             logger.info(f"Found {len(scrapes)} scrapes to process")
 
@@ -82,22 +190,11 @@ class ScraperOrchestrator:
                 logger.info("No pending scrapes found")
                 return
 
-            # Step 2: Mark as "scraping" in database
-            scrape_ids = [s['id'] for s in scrapes]
-            await self.d1.update_status(scrape_ids, 'scraping')
-
-            # Step 3: Process each scrape
-            for scrape in scrapes:
-                await self.process_scrape(scrape)
-                self.stats['processed'] += 1
-
-                # Log progress every 10 items
-                if self.stats['processed'] % 10 == 0:
-                    logger.info(f"Progress: {self.stats['processed']}/{len(scrapes)}")
+            # Step 3: Push scrapes through the fetch -> commit pipeline
+            await self.process_all(scrapes)
 
-            # Step 4: Save final stats
+            # Step 4: Final stats are saved below, once D1 is flushed
             self.stats['completed_at'] = datetime.now(timezone.utc).isoformat()
-            self.save_stats()
 
             logger.info(f"Completed: {self.stats['succeeded']} succeeded, {self.stats['failed']} failed")
 
@@ -105,104 +202,446 @@ class ScraperOrchestrator:
             logger.error(f"Fatal error: {e}", exc_info=True)
             raise
         finally:
-            # Clean up HTTP sessions
-            await self.d1.close()
+            await self.scraper.close()
+            try:
+                # Write buffered results, then hand back anything we claimed
+                # but did not finish so another run can pick it up now
+                try:
+                    await self.d1.flush()
+                finally:
+                    if claimed:
+                        await self.d1.release_leases(self.lease_owner)
+            finally:
+                # Clean up HTTP sessions, the journal and the R2 thread pool
+                try:
+                    await self.d1.close()
+                finally:
+                    try:
+                        if self.journal:
+                            await self.journal.close()
+                    finally:
+                        self.r2.close()
+                        # Includes the final flush, so D1 time is complete
+                        self.stats['d1'] = self.d1.stats()
+                        self.save_stats()
+
+    async def process_all(self, scrapes: list):
+        """Run scrapes through the staged pipeline"""
+        total = len(scrapes)
+
+        async def commit(job: dict):
+            try:
+                await self.commit_stage(job)
+            finally:
+                await self._record_processed(total)
+
+        pipeline = Pipeline(
+            [
+                Stage('fetch', self._unless_uploaded(self.fetch_stage), self.stage_workers['fetch']),
+                Stage('parse', self._unless_uploaded(self.parse_stage), self.stage_workers['parse']),
+                Stage('download', self._unless_uploaded(self.download_stage), self.stage_workers['download']),
+                Stage('upload', self._unless_uploaded(self.upload_stage), self.stage_workers['upload']),
+                Stage('commit', commit, self.stage_workers['commit']),
+            ],
+            queue_depth=self.queue_depth
+        )
 
-    async def process_scrape(self, scrape: dict):
-        """Process a single document scrape"""
-        scrape_id = scrape['id']
-        chilecompra_code = scrape['chilecompra_code']
-        detail_url = scrape['detail_url']
+        self._codes_by_id.update((scrape['id'], scrape['chilecompra_code']) for scrape in scrapes)
+        jobs = (self._new_job(scrape) for scrape in scrapes)
+        try:
+            await pipeline.run(jobs)
+        finally:
+            self.stats['stages'] = pipeline.stats()
+            self.stats['concurrency'] = self.scraper.concurrency.stats()
+            self.stats['parsing'] = self.scraper.parse_stats
+            self.stats['d1_breaker'] = self.d1.breaker.stats()
+
+    def _new_job(self, scrape: dict) -> dict:
+        """Build a pipeline job, resuming from journaled progress if there is any"""
+        job = {
+            'scrape_id': scrape['id'],
+            'chilecompra_code': scrape['chilecompra_code'],
+            'detail_url': scrape['detail_url'],
+            'scrape_attempts': scrape.get('scrape_attempts') or 0,
+        }
+        if self.journal and self.resume:
+            commit = self.journal.uploaded(scrape['chilecompra_code'])
+            files = self.journal.files(scrape['chilecompra_code'])
+            if commit is not None:
+                # Everything is in R2 already; only the D1 write is missing
+                job['commit'] = commit
+            elif files:
+                job['journaled_files'] = files
+            if commit is not None or files:
+                self.stats['resumed'] += 1
+                logger.info(
+                    f"Resuming {scrape['chilecompra_code']} "
+                    f"({'uploaded' if commit is not None else f'{len(files)} files uploaded'})"
+                )
+        return job
 
-        logger.info(f"Processing {chilecompra_code}")
+    @staticmethod
+    def _unless_uploaded(handler):
+        """Pass jobs that already have a D1 commit from the journal straight through"""
+        async def stage(job: dict) -> dict:
+            if 'commit' in job:
+                return job
+            return await handler(job)
+        return stage
+
+    async def _record_processed(self, total: int):
+        """Count a finished scrape and log progress every 10 items"""
+        async with self._stats_lock:
+            self.stats['processed'] += 1
+            if self.stats['processed'] % 10 == 0 or self.stats['processed'] == total:
+                logger.info(f"Progress: {self.stats['processed']}/{total}")
+
+    async def _add_stats(self, **counts):
+        """Increment stats counters atomically with respect to other workers"""
+        async with self._stats_lock:
+            for name, value in counts.items():
+                self.stats[name] += value
+
+    async def fetch_stage(self, job: dict) -> dict:
+        """Stage 1: fetch the purchase detail page"""
+        logger.info(f"Processing {job['chilecompra_code']}")
+        if self.scraper.stream_detail:
+            # Parsed while downloading; the parse stage has nothing left to do
+            parsed = await self.scraper.fetch_parsed_detail(job['detail_url'])
+            if not parsed:
+                raise ScrapeError("Failed to fetch detail page")
+            job['parsed'] = parsed
+            return job
+
+        detail_html = await self.scraper.fetch_detail(job['detail_url'])
+        if not detail_html:
+            raise ScrapeError("Failed to fetch detail page")
+        job['detail_html'] = detail_html
+        return job
+
+    async def parse_stage(self, job: dict) -> dict:
+        """Stage 2: extract the PDF report and attachments URLs"""
+        if 'parsed' not in job:
+            job['parsed'] = await self.scraper.parse_detail(job.pop('detail_html'))
+        return job
+
+    async def download_stage(self, job: dict) -> dict:
+        """Stage 3: download the PDF report and attachments"""
+        # Skip files an interrupted run already uploaded
+        journaled = job.get('journaled_files', {}).values()
+        job['result'] = await self.scraper.download_documents(
+            job['parsed'],
+            skip_pdf=any(not record.get('attachment') for record in journaled),
+            skip_filenames={record['filename'] for record in journaled if record.get('attachment')}
+        )
+        return job
+
+    async def upload_stage(self, job: dict) -> dict:
+        """Stage 4: upload downloaded files and metadata to R2 (unless dry run)"""
+        chilecompra_code = job['chilecompra_code']
+        result = job['result']
+        r2_folder = f"raw/{chilecompra_code}/"
+
+        # Files a previous, interrupted run already uploaded count as uploaded
+        journaled = job.get('journaled_files', {})
+        job['uploaded_files'] = list(journaled)
+        job['attachment_keys'] = [
+            (record, key) for key, record in journaled.items() if record.get('attachment')
+        ]
+        job['total_bytes'] = sum(record['size'] for record in journaled.values())
+
+        if not self.dry_run:
+            # Upload main PDF report
+            if result.get('pdf_report'):
+                key = f"{r2_folder}purchase_order.pdf"
+                await self.r2.upload_file(
+                    key=key,
+                    fileobj=result['pdf_report'],
+                    content_type='application/pdf'
+                )
+                self._journal_file(job, key, 'purchase_order.pdf', file_size(result['pdf_report']))
+
+            # Upload attachments
+            for attachment in result.get('attachments', []):
+                if attachment.get('size'):
+                    filename = self.sanitize_filename(attachment['filename'])
+                    key = f"{r2_folder}{filename}"
+                    await self.r2.upload_file(
+                        key=key,
+                        fileobj=attachment['file'],
+                        content_type=attachment.get('content_type', 'application/octet-stream')
+                    )
+                    self._journal_file(job, key, attachment['filename'], attachment['size'], attachment)
+
+            # Upload metadata
+            metadata = {
+                'chilecompra_code': chilecompra_code,
+                'scraped_at': datetime.now(timezone.utc).isoformat(),
+                'pdf_report_url': job['parsed'].get('pdf_report_url'),
+                'attachment_count': len(job['attachment_keys']),
+                'files': job['uploaded_files'],
+                'failed_attachments': [a['filename'] for a in result.get('failed_attachments', [])]
+            }
+            await self.r2.upload_json(
+                key=f"{r2_folder}metadata.json",
+                data=metadata
+            )
 
-        try:
-            # Step 1: Scrape the purchase order
-            result = await self.scraper.scrape_purchase(
-                chilecompra_code=chilecompra_code,
-                detail_url=detail_url
+            await self._add_stats(
+                files_uploaded=len(job['uploaded_files']) - len(journaled),
+                total_bytes=job['total_bytes'] - sum(record['size'] for record in journaled.values())
+            )
+
+        job['commit'] = self._build_commit(job)
+        if self.journal:
+            self.journal.record(
+                'uploaded',
+                chilecompra_code,
+                scrape_id=job['scrape_id'],
+                commit=job['commit']
+            )
+        return job
+
+    def _journal_file(self, job: dict, key: str, filename: str, size: int, attachment: dict = None):
+        """Note an uploaded file on the job and in the journal"""
+        record = {'filename': filename, 'size': size}
+        if attachment is not None:
+            record.update(
+                attachment=True,
+                file_type=attachment.get('file_type'),
+                content_type=attachment.get('content_type')
+            )
+            job['attachment_keys'].append((record, key))
+        job['uploaded_files'].append(key)
+        job['total_bytes'] += size
+        if self.journal:
+            self.journal.record(
+                'file',
+                job['chilecompra_code'],
+                scrape_id=job['scrape_id'],
+                key=key,
+                **record
             )
 
-            if not result['success']:
-                raise Exception(result.get('error', 'Unknown scraping error'))
+    async def commit_stage(self, job: dict):
+        """Stage 5: record the outcome of the scrape in D1"""
+        # Files are uploaded (or the job failed) by now, so drop the spools
+        if job.get('result'):
+            self.scraper.close_documents(job['result'])
+
+        scrape_id = job['scrape_id']
+        chilecompra_code = job['chilecompra_code']
+
+        if not job.get('error'):
+            try:
+                # Attachment rows and the status update are buffered and
+                # written to D1 together with other purchases in one batched
+                # round trip; once buffered, D1Client retries them itself
+                await self.d1.queue_commit(job['commit'])
+            except Exception as e:
+                job['error'] = str(e)
+                job['exception'] = e
+                job['failed_stage'] = 'commit'
+            else:
+                await self._record_success(job)
+                return
 
-            # Step 2: Upload files to R2 (unless dry run)
-            if not self.dry_run:
-                r2_folder = f"raw/{chilecompra_code}/"
-                uploaded_files = []
-                total_bytes = 0
+        transient = self.is_transient(job)
+        await self._add_stats(failed=1)
+        logger.error(
+            f"[FAIL] {chilecompra_code} ({job['failed_stage']}, "
+            f"{'transient' if transient else 'permanent'}): {job['error']}"
+        )
 
-                # Upload main PDF report
-                if result.get('pdf_report'):
-                    key = f"{r2_folder}purchase_order.pdf"
-                    await self.r2.upload_bytes(
-                        key=key,
-                        data=result['pdf_report'],
-                        content_type='application/pdf'
-                    )
-                    uploaded_files.append(key)
-                    total_bytes += len(result['pdf_report'])
-
-                # Upload attachments
-                for attachment in result.get('attachments', []):
-                    if attachment.get('content'):
-                        filename = self.sanitize_filename(attachment['filename'])
-                        key = f"{r2_folder}{filename}"
-                        await self.r2.upload_bytes(
-                            key=key,
-                            data=attachment['content'],
-                            content_type=attachment.get('content_type', 'application/octet-stream')
-                        )
-                        uploaded_files.append(key)
-                        total_bytes += len(attachment['content'])
-
-                        # Record attachment in D1
-                        await self.d1.insert_attachment(
-                            document_scrape_id=scrape_id,
-                            filename=attachment['filename'],
-                            file_type=attachment.get('file_type'),
-                            r2_key=key,
-                            file_size=len(attachment['content']),
-                            content_type=attachment.get('content_type')
-                        )
-
-                # Upload metadata
-                metadata = {
-                    'chilecompra_code': chilecompra_code,
-                    'scraped_at': datetime.now(timezone.utc).isoformat(),
-                    'pdf_report_url': result.get('pdf_report_url'),
-                    'attachment_count': len(result.get('attachments', [])),
-                    'files': uploaded_files
-                }
-                await self.r2.upload_json(
-                    key=f"{r2_folder}metadata.json",
-                    data=metadata
-                )
+        # Buffer the failure; D1Client flushes it in the background and
+        # schedules a retry for transient failures
+        await self.d1.queue_failure(
+            scrape_id=scrape_id,
+            error=job['error'],
+            attempts=job['scrape_attempts'],
+            transient=transient
+        )
 
-                self.stats['files_uploaded'] += len(uploaded_files)
-                self.stats['total_bytes'] += total_bytes
+    @staticmethod
+    def is_transient(job: dict) -> bool:
+        """Whether a failed job is worth retrying later"""
+        exception = job.get('exception')
+        if isinstance(exception, ScrapeError):
+            return exception.transient
+        # Parsing is deterministic: the same page fails the same way again.
+        # Network, storage and D1 errors are assumed to be temporary.
+        return job.get('failed_stage') != 'parse'
+
+    def _build_commit(self, job: dict) -> dict:
+        """The D1 commit dict (see D1Client.queue_commit) for an uploaded job"""
+        chilecompra_code = job['chilecompra_code']
+        failed_attachments = job['result'].get('failed_attachments', [])
+
+        if self.dry_run:
+            # Nothing was uploaded: record what was found, but no attachment
+            # rows, which repair mode would take for real work
+            return {
+                'scrape_id': job['scrape_id'],
+                'r2_folder': f"raw/{chilecompra_code}/",
+                'attachment_count': len(job['result'].get('attachments', [])),
+                'total_file_size': 0,
+                'pdf_report_url': job['parsed'].get('pdf_report_url'),
+                'attachments_url': job['parsed'].get('attachments_url'),
+                'attachments': []
+            }
+
+        # Failed downloads get their own rows so repair mode can fetch
+        # just those files later
+        return {
+            'scrape_id': job['scrape_id'],
+            'r2_folder': f"raw/{chilecompra_code}/",
+            'attachment_count': len(job['attachment_keys']),
+            'total_file_size': job['total_bytes'],
+            'pdf_report_url': job['parsed'].get('pdf_report_url'),
+            'attachments_url': job['parsed'].get('attachments_url'),
+            'attachments': [
+                {
+                    'filename': attachment['filename'],
+                    'file_type': attachment.get('file_type'),
+                    'r2_key': key,
+                    'file_size': attachment['size'],
+                    'content_type': attachment.get('content_type')
+                }
+                for attachment, key in job['attachment_keys']
+            ] + [
+                {
+                    'filename': attachment['filename'],
+                    'file_type': attachment.get('file_type'),
+                    'r2_key': None,
+                    'file_size': None,
+                    'download_status': 'failed',
+                    'download_error': attachment['error']
+                }
+                for attachment in failed_attachments
+            ]
+        }
 
-            # Step 3: Update D1 with success
-            await self.d1.update_scrape_success(
-                scrape_id=scrape_id,
-                r2_folder=f"raw/{chilecompra_code}/",
-                attachment_count=len(result.get('attachments', [])),
-                total_file_size=total_bytes if not self.dry_run else 0,
-                pdf_report_url=result.get('pdf_report_url')
+    async def _record_success(self, job: dict):
+        """Count and log a scrape whose commit D1Client has accepted"""
+        chilecompra_code = job['chilecompra_code']
+        commit = job['commit']
+
+        failed = sum(1 for a in commit['attachments'] if a.get('download_status') == 'failed')
+        await self._add_stats(succeeded=1, attachments_failed=failed)
+        if failed:
+            logger.warning(
+                f"[OK] {chilecompra_code}: {commit['attachment_count']} attachments, "
+                f"{failed} failed (left for repair)"
             )
+        else:
+            logger.info(f"[OK] {chilecompra_code}: {commit['attachment_count']} attachments")
+
+    def _on_d1_flush(self, scrape_ids: list):
+        """Journal scrapes whose outcome D1 now holds"""
+        if not self.journal:
+            return
+        for scrape_id in scrape_ids:
+            chilecompra_code = self._codes_by_id.get(scrape_id)
+            if chilecompra_code:
+                self.journal.record('committed', chilecompra_code, scrape_id=scrape_id)
+
+    async def repair(self):
+        """
+        Re-download attachments whose download failed in an earlier run.
+
+        Works from the attachments page URL stored with each scrape, so only
+        the missing files are fetched again. BATCH_SIZE caps the number of
+        scrapes repaired per run.
+        """
+        logger.info(f"Starting attachment repair (batch_size={self.batch_size}, dry_run={self.dry_run})")
+        try:
+            rows = await self.d1.get_failed_attachments(limit=self.batch_size)
+            by_scrape = {}
+            for row in rows:
+                by_scrape.setdefault(row['document_scrape_id'], []).append(row)
+            logger.info(f"Found {len(rows)} failed attachments in {len(by_scrape)} scrapes")
+
+            workers = asyncio.Semaphore(self.purchase_workers)
+
+            async def repair_one(scrape_id: int, attachments: list):
+                async with workers:
+                    try:
+                        await self._repair_scrape(scrape_id, attachments)
+                    except Exception as e:
+                        logger.error(f"[FAIL] repair of {attachments[0]['chilecompra_code']}: {e}")
+                    await self._record_processed(len(by_scrape))
+
+            await asyncio.gather(*(
+                repair_one(scrape_id, attachments)
+                for scrape_id, attachments in by_scrape.items()
+            ))
+
+            self.stats['concurrency'] = self.scraper.concurrency.stats()
+            self.stats['parsing'] = self.scraper.parse_stats
+            self.stats['d1_breaker'] = self.d1.breaker.stats()
+            self.stats['completed_at'] = datetime.now(timezone.utc).isoformat()
+            logger.info(f"Repair complete: {self.stats}")
 
-            self.stats['succeeded'] += 1
-            logger.info(f"[OK] {chilecompra_code}: {len(result.get('attachments', []))} attachments")
-
-        except Exception as e:
-            self.stats['failed'] += 1
-            logger.error(f"[FAIL] {chilecompra_code}: {e}")
+        finally:
+            await self.scraper.close()
+            try:
+                await self.d1.close()
+            finally:
+                self.r2.close()
+                self.stats['d1'] = self.d1.stats()
+                self.save_stats()
+
+    async def _repair_scrape(self, scrape_id: int, attachments: list):
+        """Download, upload and record the failed attachments of one scrape"""
+        chilecompra_code = attachments[0]['chilecompra_code']
+        ids_by_filename = {a['filename']: a['id'] for a in attachments}
 
-            # Update D1 with failure
-            await self.d1.update_scrape_failed(
-                scrape_id=scrape_id,
-                error=str(e)
+        try:
+            downloaded, failed = await self.scraper.download_attachments(
+                attachments[0]['attachments_url'],
+                list(ids_by_filename)
             )
+        except ScrapeError as e:
+            downloaded, failed = [], [{'filename': name, 'error': str(e)} for name in ids_by_filename]
+
+        repaired = []
+        try:
+            for attachment in downloaded:
+                key = f"raw/{chilecompra_code}/{self.sanitize_filename(attachment['filename'])}"
+                if not self.dry_run:
+                    await self.r2.upload_file(
+                        key=key,
+                        fileobj=attachment['file'],
+                        content_type=attachment.get('content_type', 'application/octet-stream')
+                    )
+                repaired.append({
+                    'id': ids_by_filename[attachment['filename']],
+                    'r2_key': key,
+                    'file_size': attachment['size'],
+                    'content_type': attachment.get('content_type')
+                })
+        finally:
+            self.scraper.close_documents({'attachments': downloaded})
+
+        if self.dry_run:
+            logger.info(f"[DRY RUN] {chilecompra_code}: {len(repaired)} attachments downloaded")
+            return
+
+        await self.d1.commit_attachment_repairs(
+            scrape_id,
+            repaired=repaired,
+            failed=[
+                {'id': ids_by_filename[attachment['filename']], 'error': attachment['error']}
+                for attachment in failed
+            ]
+        )
+        await self._add_stats(
+            attachments_repaired=len(repaired),
+            attachments_failed=len(failed),
+            files_uploaded=len(repaired),
+            total_bytes=sum(a['file_size'] for a in repaired)
+        )
+        logger.info(f"[REPAIR] {chilecompra_code}: {len(repaired)} repaired, {len(failed)} still failing")
 
     @staticmethod
     def sanitize_filename(filename: str) -> str:
@@ -228,8 +667,24 @@ async def main():
     if not test_ids and os.environ.get('CHILECOMPRA_CODES'):
         test_ids = [id.strip() for id in os.environ['CHILECOMPRA_CODES'].split(',')]
 
+    repair = (
+        '--repair-attachments' in sys.argv
+        or os.environ.get('REPAIR_ATTACHMENTS', 'false').lower() == 'true'
+    )
+
     orchestrator = ScraperOrchestrator()
-    await orchestrator.run(test_ids=test_ids)
+
+    # On SIGTERM/SIGINT (job timeout or cancellation), cancel the run so its
+    # cleanup still flushes buffered D1 updates before the process exits
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, task.cancel)
+
+    if repair:
+        await orchestrator.repair()
+    else:
+        await orchestrator.run(test_ids=test_ids)
 
 
 if __name__ == '__main__':
@@ -4,15 +4,41 @@ Scraper for MercadoPublico.cl purchase orders and attachments.
 
 import asyncio
 import aiohttp
+import codecs
+import multiprocessing
+import os
 import random
-import re
 import logging
-from urllib.parse import urljoin, urlparse, parse_qs, urlencode
-from bs4 import BeautifulSoup
-from typing import Optional, Dict, List, Any, Tuple
+import tempfile
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlparse, parse_qs, urlencode
+from typing import IO, Callable, Optional, Dict, List, Any, Tuple, Union
+
+from .parsing import DetailStreamParser, ParsedPage, get_parser, normalize_url, parse_page
+from .throttling import AdaptiveConcurrencyLimiter, HostRateLimiter
 
 logger = logging.getLogger(__name__)
 
+PARSE_POOLS = ('none', 'thread', 'process')
+
+
+class ScrapeError(Exception):
+    """A scrape failure; `transient` says whether retrying later may succeed"""
+
+    def __init__(self, message: str, transient: bool = True):
+        super().__init__(message)
+        self.transient = transient
+
+
+def file_size(fileobj: IO[bytes]) -> int:
+    """Size of a seekable file object; leaves the position at the start"""
+    fileobj.seek(0, 2)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    return size
+
 
 class MercadoPublicoScraper:
     BASE_URL = "https://www.mercadopublico.cl"
@@ -25,13 +51,90 @@ class MercadoPublicoScraper:
         max_concurrent: int = 5,
         delay_range: tuple = (1.5, 3.0),
         max_retries: int = 3,
-        timeout: int = 30
+        timeout: int = 30,
+        limit_per_host: int = 0,
+        dns_ttl: int = 300,
+        requests_per_second: Optional[float] = None,
+        burst: int = 1,
+        max_concurrency_limit: int = 0,
+        spool_max_memory: int = 1024 * 1024,
+        spool_dir: Optional[str] = None,
+        chunk_size: int = 64 * 1024,
+        parser_backend: str = 'lxml',
+        parser_verify_rate: float = 0.0,
+        stream_detail: bool = False,
+        parse_pool: str = 'none',
+        parse_pool_size: int = 0,
+        parse_offload_threshold: int = 64 * 1024
     ):
         self.max_concurrent = max_concurrent
         self.delay_range = delay_range
         self.max_retries = max_retries
         self.timeout = timeout
-        self.semaphore = asyncio.Semaphore(max_concurrent)
+        # The concurrency limit starts at max_concurrent and adapts (AIMD)
+        # between 1 and max_concurrency_limit (0 means 4x max_concurrent)
+        self.concurrency = AdaptiveConcurrencyLimiter(
+            initial=max_concurrent,
+            max_limit=max_concurrency_limit or max_concurrent * 4
+        )
+        # 0 means "same as the concurrency ceiling" so pooled connections match request slots
+        self.limit_per_host = limit_per_host or self.concurrency.max_limit
+        self.dns_ttl = dns_ttl
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # Binary downloads stream into spooled temp files: up to
+        # spool_max_memory bytes stay in RAM, larger files roll over to disk
+        self.spool_max_memory = spool_max_memory
+        self.spool_dir = spool_dir
+        self.chunk_size = chunk_size
+
+        # By default, allow the rate that max_concurrent slots each sleeping
+        # delay_range between requests would produce, with the delay spread
+        # as jitter, but without the sleeping slots
+        mean_delay = sum(delay_range) / 2
+        if requests_per_second is None:
+            requests_per_second = max_concurrent / mean_delay
+        self.requests_per_second = requests_per_second
+        self.rate_limiter = HostRateLimiter(
+            rate=requests_per_second,
+            burst=burst,
+            jitter=(delay_range[1] - delay_range[0]) / mean_delay if mean_delay else 0.0
+        )
+
+        # HTML parsing backend; a `parser_verify_rate` share of pages is also
+        # parsed with BeautifulSoup and the bs4 result wins on divergence
+        self.parser = get_parser(parser_backend)
+        self.parser_verify_rate = parser_verify_rate
+        self.parse_stats = {
+            'verified': 0, 'error': 0, 'empty': 0, 'divergence': 0,
+            'early_exit': 0, 'stream_fallback': 0, 'offloaded': 0
+        }
+        # Parse detail pages while they download and stop reading once
+        # both URLs are found (see fetch_parsed_detail)
+        self.stream_detail = stream_detail
+
+        # Pages of at least parse_offload_threshold characters are parsed in
+        # a worker pool ('thread' or 'process', parse_pool_size workers, 0
+        # means one per CPU) so parsing never stalls the event loop; smaller
+        # pages parse inline, where shipping them out would cost more than
+        # parsing them
+        if parse_pool not in PARSE_POOLS:
+            raise ValueError(f"Unknown parse pool '{parse_pool}' (choose from {', '.join(PARSE_POOLS)})")
+        self.parse_pool = parse_pool
+        self.parse_pool_size = parse_pool_size or os.cpu_count() or 1
+        self.parse_offload_threshold = parse_offload_threshold
+        self._parse_executor: Optional[Executor] = None
+        if parse_pool == 'thread':
+            self._parse_executor = ThreadPoolExecutor(
+                max_workers=self.parse_pool_size,
+                thread_name_prefix='parse'
+            )
+        elif parse_pool == 'process':
+            # spawn: forking a process that runs boto3 and event loop threads is unsafe
+            self._parse_executor = ProcessPoolExecutor(
+                max_workers=self.parse_pool_size,
+                mp_context=multiprocessing.get_context('spawn')
+            )
 
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -40,52 +143,185 @@ class MercadoPublicoScraper:
             'Connection': 'keep-alive',
         }
 
-    async def _rate_limit(self):
-        """Apply random delay between requests"""
-        delay = random.uniform(*self.delay_range)
-        await asyncio.sleep(delay)
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get or create the long-lived HTTP session shared by all purchases"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit_per_host * 2,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """Close the HTTP session, its connection pool and the parse pool"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+            self._session = None
+        if self._parse_executor:
+            self._parse_executor.shutdown(wait=True, cancel_futures=True)
+            self._parse_executor = None
+
+    async def __aenter__(self) -> 'MercadoPublicoScraper':
+        await self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _rate_limit(self, url: str):
+        """Wait for the per-host token bucket (does not hold a concurrency slot)"""
+        await self.rate_limiter.acquire(url)
+
+    async def _spool_response(self, response: aiohttp.ClientResponse) -> Optional[IO[bytes]]:
+        """Stream a response body into a spooled temp file, or None if it is empty"""
+        spool = tempfile.SpooledTemporaryFile(
+            max_size=self.spool_max_memory,
+            dir=self.spool_dir
+        )
+        try:
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+
+        if spool.tell() == 0:
+            spool.close()
+            return None
+        spool.seek(0)
+        return spool
 
-    async def _fetch(
+    async def _stream_parse(
+        self,
+        response: aiohttp.ClientResponse,
+        parser: DetailStreamParser
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Feed a text response to an incremental parser until it is done or the body ends.
+
+        Returns (parser result, html). html is the whole body when it was
+        read to the end, so a caller can parse it in full without fetching
+        the page again, and None after an early exit.
+        """
+        decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+        chunks = []
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            text = decoder.decode(chunk)
+            chunks.append(text)
+            # A parser that failed is done too, but the page is still needed
+            if parser.feed(text) and not parser.failed:
+                # Leaving the response unread closes its connection instead
+                # of returning it to the pool, which is cheaper than
+                # downloading the rest of a large page
+                self.parse_stats['early_exit'] += 1
+                return parser.close(), None
+        chunks.append(decoder.decode(b'', final=True))
+        parser.feed(chunks[-1])
+        return parser.close(), ''.join(chunks)
+
+    async def _request(
         self,
         session: aiohttp.ClientSession,
+        method: str,
         url: str,
-        binary: bool = False
-    ) -> Optional[bytes | str]:
-        """Fetch URL with retry logic"""
-        async with self.semaphore:
-            await self._rate_limit()
+        binary: bool,
+        permanent_statuses: Tuple[int, ...] = (),
+        stream_parser: Optional[Callable[[], DetailStreamParser]] = None,
+        **kwargs
+    ) -> Optional[IO[bytes] | str | Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+        """
+        Send a request with retry logic.
+
+        Text responses are returned as str; binary responses are streamed
+        into a spooled temp file positioned at the start, which the caller
+        must close.
 
-            for attempt in range(self.max_retries):
+        Each attempt first waits for the rate limiter, then holds a concurrency
+        slot only while the request is in flight. Backoff sleeps happen
+        outside the slot so idle waiting never blocks other requests.
+        Outcomes feed the adaptive concurrency limit: 429s, 5xx and timeouts
+        cut it for every worker, healthy responses slowly raise it.
+
+        A status in `permanent_statuses` raises a non-transient ScrapeError
+        right away instead of being retried.
+
+        With `stream_parser`, a text body is fed chunk by chunk to a fresh
+        parser from that factory and (result, html) is returned as by
+        _stream_parse(); reading stops as soon as the parser has what it
+        needs.
+        """
+        # Keep the historical log wording: "Rate limited on POST", "POST Timeout", ...
+        on_method = ' on POST' if method == 'POST' else ''
+        log_prefix = 'POST ' if method == 'POST' else ''
+        # Latency is judged per page type, not across pages of very different size
+        kind = f"{method} {urlparse(url).path}"
+
+        for attempt in range(self.max_retries):
+            await self._rate_limit(url)
+            backoff = 2 ** attempt
+
+            async with self.concurrency:
+                started = time.monotonic()
                 try:
-                    async with session.get(
+                    async with session.request(
+                        method,
                         url,
-                        headers=self.headers,
-                        timeout=aiohttp.ClientTimeout(total=self.timeout)
+                        timeout=aiohttp.ClientTimeout(total=self.timeout),
+                        **kwargs
                     ) as response:
 
                         if response.status == 200:
                             if binary:
-                                return await response.read()
-                            return await response.text()
+                                body = await self._spool_response(response)
+                                # Large downloads say nothing about server load
+                                self.concurrency.on_success()
+                            elif stream_parser:
+                                body = await self._stream_parse(response, stream_parser())
+                                # Early exits are much faster than full reads of the same page
+                                self.concurrency.on_success(time.monotonic() - started, f"{kind} (streamed)")
+                            else:
+                                body = await response.text()
+                                self.concurrency.on_success(time.monotonic() - started, kind)
+                            return body
 
                         elif response.status == 429:
                             # Rate limited
-                            wait = (2 ** attempt) * 10
-                            logger.warning(f"Rate limited, waiting {wait}s")
-                            await asyncio.sleep(wait)
+                            self.concurrency.on_overload('HTTP 429')
+                            backoff = (2 ** attempt) * 10
+                            logger.warning(f"Rate limited{on_method}, waiting {backoff}s")
+
+                        elif response.status in permanent_statuses:
+                            raise ScrapeError(f"HTTP {response.status}: {url}", transient=False)
 
                         else:
-                            logger.warning(f"HTTP {response.status}: {url}")
+                            if response.status >= 500:
+                                self.concurrency.on_overload(f"HTTP {response.status}")
+                            logger.warning(f"HTTP {response.status}{on_method}: {url}")
 
+                except ScrapeError:
+                    raise
                 except asyncio.TimeoutError:
-                    logger.warning(f"Timeout (attempt {attempt + 1}): {url}")
+                    self.concurrency.on_overload('timeout')
+                    logger.warning(f"{log_prefix}Timeout (attempt {attempt + 1}): {url}")
                 except Exception as e:
-                    logger.warning(f"Error (attempt {attempt + 1}): {e}")
+                    logger.warning(f"{log_prefix}Error (attempt {attempt + 1}): {e}")
 
-                if attempt < self.max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)
+            if attempt < self.max_retries - 1:
+                await asyncio.sleep(backoff)
 
-            return None
+        return None
+
+    async def _fetch(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        binary: bool = False
+    ) -> Optional[IO[bytes] | str]:
+        """Fetch URL with retry logic"""
+        return await self._request(session, 'GET', url, binary, headers=self.headers)
 
     async def _post_form(
         self,
@@ -93,72 +329,25 @@ class MercadoPublicoScraper:
         url: str,
         form_data: Dict[str, str],
         binary: bool = True
-    ) -> Optional[bytes | str]:
+    ) -> Optional[IO[bytes] | str]:
         """POST form data with retry logic (for ASP.NET postbacks)"""
-        async with self.semaphore:
-            await self._rate_limit()
-
-            headers = {
-                **self.headers,
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'Origin': self.BASE_URL,
-                'Referer': url,
-            }
-
-            for attempt in range(self.max_retries):
-                try:
-                    async with session.post(
-                        url,
-                        headers=headers,
-                        data=form_data,
-                        timeout=aiohttp.ClientTimeout(total=self.timeout)
-                    ) as response:
-
-                        if response.status == 200:
-                            if binary:
-                                return await response.read()
-                            return await response.text()
-
-                        elif response.status == 429:
-                            wait = (2 ** attempt) * 10
-                            logger.warning(f"Rate limited on POST, waiting {wait}s")
-                            await asyncio.sleep(wait)
-
-                        else:
-                            logger.warning(f"HTTP {response.status} on POST: {url}")
-
-                except asyncio.TimeoutError:
-                    logger.warning(f"POST Timeout (attempt {attempt + 1}): {url}")
-                except Exception as e:
-                    logger.warning(f"POST Error (attempt {attempt + 1}): {e}")
-
-                if attempt < self.max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)
-
-            return None
+        headers = {
+            **self.headers,
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Origin': self.BASE_URL,
+            'Referer': url,
+        }
+        return await self._request(
+            session, 'POST', url, binary,
+            headers=headers,
+            data=form_data
+        )
 
-    def _extract_aspnet_form_fields(self, html: str) -> Dict[str, str]:
+    def _extract_aspnet_form_fields(self, html: Union[str, ParsedPage]) -> Dict[str, str]:
         """Extract ASP.NET hidden form fields (__VIEWSTATE, __EVENTVALIDATION, etc.)"""
-        soup = BeautifulSoup(html, 'lxml')
-        form_data = {}
-
-        # Common ASP.NET hidden fields
-        field_names = [
-            '__VIEWSTATE',
-            '__VIEWSTATEGENERATOR',
-            '__EVENTVALIDATION',
-            '__EVENTTARGET',
-            '__EVENTARGUMENT',
-            '__PREVIOUSPAGE',
-            '__VIEWSTATEENCRYPTED',
-        ]
-
-        for name in field_names:
-            field = soup.find('input', {'name': name})
-            if field and field.get('value') is not None:
-                form_data[name] = field.get('value', '')
-
-        return form_data
+        if isinstance(html, ParsedPage):
+            return html.form_fields()
+        return self.parser.form_fields(html)
 
     def _extract_qs_param(self, url: str) -> Optional[str]:
         """Extract the 'qs' parameter from URL"""
@@ -167,231 +356,63 @@ class MercadoPublicoScraper:
         return params.get('qs', [None])[0]
 
     def _normalize_url(self, url: str) -> str:
-        """Normalize URL by resolving ../ and cleaning up the path using urljoin"""
-        # Use a simpler approach: let the browser-style resolution handle it
-        # by joining with the base URL
-        parsed = urlparse(url)
+        """Normalize URL by resolving ../ and cleaning up the path"""
+        return normalize_url(url)
+
+    def _sample_verify(self) -> bool:
+        return self.parser_verify_rate > 0 and random.random() < self.parser_verify_rate
+
+    async def _parse(self, kind: str, html: str, *args, verify: Optional[bool] = None):
+        """
+        Run a page parser, counting bs4 fallbacks and verifications in parse_stats.
+
+        Large pages go to the parse pool, if there is one; a pool whose
+        workers died is dropped and parsing continues inline.
+        """
+        if verify is None:
+            verify = self._sample_verify()
+        parse = partial(parse_page, kind, html, *args, backend=self.parser.name, verify=verify)
+
+        executor = self._parse_executor
+        if executor and len(html) >= self.parse_offload_threshold:
+            loop = asyncio.get_running_loop()
+            try:
+                result, event = await loop.run_in_executor(executor, parse)
+                self.parse_stats['offloaded'] += 1
+            except BrokenExecutor as e:
+                logger.warning(f"Parse pool broken ({e}), parsing inline from now on")
+                if self._parse_executor is executor:
+                    self._parse_executor = None
+                    executor.shutdown(wait=False, cancel_futures=True)
+                result, event = parse()
+        else:
+            result, event = parse()
+        if event:
+            self.parse_stats[event] += 1
+        return result
 
-        # If the path contains ../, we need to resolve it
-        if '/../' in parsed.path or parsed.path.startswith('../'):
-            # Split the path and resolve manually
-            parts = parsed.path.split('/')
-            resolved = []
-            for part in parts:
-                if part == '..':
-                    if resolved and resolved[-1] != '':
-                        resolved.pop()
-                elif part == '.':
-                    continue
-                else:
-                    resolved.append(part)
-            normalized_path = '/'.join(resolved)
-            # Ensure path starts with /
-            if not normalized_path.startswith('/'):
-                normalized_path = '/' + normalized_path
-
-            if parsed.query:
-                return f"{parsed.scheme}://{parsed.netloc}{normalized_path}?{parsed.query}"
-            return f"{parsed.scheme}://{parsed.netloc}{normalized_path}"
-
-        return url
-
-    def _parse_detail_page(self, html: str) -> Dict[str, Any]:
+    async def _parse_detail_page(self, html: str, verify: Optional[bool] = None) -> Dict[str, Any]:
         """
         Parse DetailsPurchaseOrder.aspx to find:
         1. PDF Report link (from onclick handler)
         2. Attachments link (from onclick handler)
         """
-        soup = BeautifulSoup(html, 'lxml')
-        result = {
-            'pdf_report_url': None,
-            'attachments_url': None,
-        }
-
-        # Find all elements with onclick handlers
-        for elem in soup.find_all(attrs={'onclick': True}):
-            onclick = elem.get('onclick', '')
-
-            # Look for PDF Report URL
-            if 'PDFReport' in onclick:
-                # Pattern: open('PDFReport.aspx?qs=...' or window.open('...')
-                match = re.search(r"'([^']*PDFReport\.aspx\?qs=[^']+)'", onclick)
-                if match:
-                    relative_url = match.group(1)
-                    if relative_url.startswith('http'):
-                        result['pdf_report_url'] = relative_url
-                    else:
-                        result['pdf_report_url'] = f"{self.BASE_URL}/PurchaseOrder/Modules/PO/{relative_url}"
-                    logger.info(f"Found PDF URL: {result['pdf_report_url']}")
-
-            # Look for Attachments URL (ViewAttachmentPurchaseOrder)
-            if 'ViewAttachmentPurchaseOrder' in onclick or 'Attachment' in onclick:
-                match = re.search(r"'([^']*ViewAttachmentPurchaseOrder[^']+)'", onclick)
-                if match:
-                    relative_url = match.group(1)
-                    if relative_url.startswith('http'):
-                        result['attachments_url'] = relative_url
-                    elif relative_url.startswith('/'):
-                        result['attachments_url'] = f"{self.BASE_URL}{relative_url}"
-                    else:
-                        # Handle relative paths - extract just the filename and qs parameter
-                        # Pattern like: ../../../Portal/Modules/Site/AdvancedSearch/ViewAttachmentPurchaseOrder.aspx?qs=...
-                        if 'ViewAttachmentPurchaseOrder.aspx' in relative_url:
-                            # Extract just the query string part
-                            qs_match = re.search(r'\?qs=([^&\s]+)', relative_url)
-                            if qs_match:
-                                qs_param = qs_match.group(1)
-                                result['attachments_url'] = f"{self.BASE_URL}/Portal/Modules/Site/AdvancedSearch/ViewAttachmentPurchaseOrder.aspx?qs={qs_param}"
-                            else:
-                                result['attachments_url'] = f"{self.BASE_URL}/Portal/Modules/Site/AdvancedSearch/ViewAttachmentPurchaseOrder.aspx"
-                    logger.info(f"Found Attachments URL: {result['attachments_url']}")
-
-        # Also check href attributes for links
-        for link in soup.find_all('a', href=True):
-            href = link.get('href', '')
-
-            if 'PDFReport' in href and not result['pdf_report_url']:
-                if href.startswith('http'):
-                    result['pdf_report_url'] = href
-                else:
-                    result['pdf_report_url'] = urljoin(self.BASE_URL, href)
-
-            if 'ViewAttachmentPurchaseOrder' in href and not result['attachments_url']:
-                if href.startswith('http'):
-                    result['attachments_url'] = href
-                else:
-                    result['attachments_url'] = urljoin(self.BASE_URL, href)
-
-        # Normalize URLs to resolve any ../ paths
-        if result['pdf_report_url']:
-            result['pdf_report_url'] = self._normalize_url(result['pdf_report_url'])
-        if result['attachments_url']:
-            result['attachments_url'] = self._normalize_url(result['attachments_url'])
-
-        # Log what we found
+        result = await self._parse('detail', html, self.BASE_URL, verify=verify)
         logger.info(f"Parsed detail page - PDF: {result['pdf_report_url']}, Attachments: {result['attachments_url']}")
-
         return result
 
-    def _parse_attachments_page(self, html: str, base_url: str) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    async def _parse_attachments_page(self, html: str, base_url: str) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
         """
         Parse ViewAttachmentPurchaseOrder.aspx to extract attachment info.
 
-        Expected structure:
-        | Nombre del Anexo | Tipo | Fecha | Ver |
-        | COT_xxx.pdf | Cotizacion | 23-06-2025 | [input button] |
-
         The download is triggered by clicking input[type=image] buttons with names like
         'rptAttachment$ctl01$imgShow'. These trigger ASP.NET postbacks that download the file.
 
         Returns:
             Tuple of (attachments list, ASP.NET form fields dict)
         """
-        soup = BeautifulSoup(html, 'lxml')
-        attachments = []
-        seen_buttons = set()  # Track seen postback buttons to avoid duplicates
-
-        # Extract ASP.NET form fields for postback
-        form_fields = self._extract_aspnet_form_fields(html)
-        logger.debug(f"Extracted form fields: {list(form_fields.keys())}")
-
-        # Log HTML snippet for debugging
-        logger.debug(f"Attachments page HTML length: {len(html)}")
-
-        # Find all tables (there might be nested tables)
-        tables = soup.find_all('table')
-        logger.info(f"Found {len(tables)} tables in attachments page")
-
-        for table in tables:
-            rows = table.find_all('tr', recursive=False)  # Only direct children to avoid nested table dupes
-            if not rows:
-                # Try getting rows from tbody
-                tbody = table.find('tbody')
-                if tbody:
-                    rows = tbody.find_all('tr', recursive=False)
-
-            for row in rows:
-                cells = row.find_all('td', recursive=False)
-                if len(cells) >= 3:
-                    # Get text from first cells
-                    filename = cells[0].get_text(strip=True)
-                    file_type = cells[1].get_text(strip=True) if len(cells) > 1 else ''
-                    date = cells[2].get_text(strip=True) if len(cells) > 2 else ''
-
-                    # Skip header-like rows or empty rows
-                    if not filename or filename.lower() in ['nombre del anexo', 'nombre', 'anexo']:
-                        continue
-
-                    # Validate filename looks like a file (has extension)
-                    if '.' not in filename or len(filename) > 100:
-                        continue
-
-                    # Look for download link - could be <a>, onclick, or ASP.NET postback button
-                    download_url = None
-                    postback_button = None
-
-                    # Method 1: Look for <a> tag with href
-                    for cell in cells:
-                        link = cell.find('a', href=True)
-                        if link:
-                            href = link.get('href', '')
-                            if href and not href.startswith('javascript'):
-                                download_url = urljoin(base_url, href)
-                                break
-
-                    # Method 2: Look for onclick handler on any element
-                    if not download_url:
-                        for cell in cells:
-                            for elem in cell.find_all(attrs={'onclick': True}):
-                                onclick = elem.get('onclick', '')
-                                # Look for window.open or direct URL patterns
-                                url_match = re.search(r"'(https?://[^']+)'", onclick)
-                                if url_match:
-                                    download_url = url_match.group(1)
-                                    break
-                                # Look for relative URL in onclick
-                                url_match = re.search(r"'(/[^']+\.pdf[^']*)'", onclick, re.IGNORECASE)
-                                if url_match:
-                                    download_url = f"{self.BASE_URL}{url_match.group(1)}"
-                                    break
-
-                    # Method 3: For ASP.NET postback buttons, extract the button name
-                    # The imgShow buttons trigger postbacks - we simulate form POST
-                    if not download_url:
-                        img_input = row.find('input', {'type': 'image'})
-                        if img_input:
-                            input_name = img_input.get('name', '')
-                            input_id = img_input.get('id', '')
-                            if input_name and ('imgShow' in input_name or 'imgShow' in input_id or 'Show' in input_name):
-                                # Skip if we've already seen this button (duplicate from nested tables)
-                                if input_name in seen_buttons:
-                                    continue
-                                postback_button = input_name
-                                seen_buttons.add(input_name)
-                                logger.debug(f"Found postback button: {input_name} for {filename}")
-
-                    if download_url:
-                        attachments.append({
-                            'filename': filename,
-                            'file_type': file_type,
-                            'date': date,
-                            'download_url': download_url,
-                            'postback_button': None
-                        })
-                        logger.info(f"Found attachment with direct URL: {filename} -> {download_url}")
-                    elif postback_button:
-                        attachments.append({
-                            'filename': filename,
-                            'file_type': file_type,
-                            'date': date,
-                            'download_url': None,
-                            'postback_button': postback_button
-                        })
-                        logger.info(f"Found attachment with postback: {filename} -> button={postback_button}")
-                    elif filename and (filename.endswith('.pdf') or filename.endswith('.PDF')):
-                        # Log that we found a PDF but couldn't get the download URL
-                        logger.warning(f"Found attachment '{filename}' but no download URL or postback button")
-
+        attachments, form_fields = await self._parse('attachments', html, base_url, self.BASE_URL)
+        logger.debug(f"Attachments page HTML length: {len(html)}, form fields: {list(form_fields)}")
         logger.info(f"Parsed {len(attachments)} attachments from page")
         return attachments, form_fields
 
@@ -401,7 +422,7 @@ class MercadoPublicoScraper:
         page_url: str,
         button_name: str,
         form_fields: Dict[str, str]
-    ) -> Optional[bytes]:
+    ) -> Optional[IO[bytes]]:
         """
         Download a file by simulating ASP.NET postback button click.
 
@@ -424,130 +445,261 @@ class MercadoPublicoScraper:
         if content:
             # Check if we got HTML back (error page) or actual file content
             # PDF files start with %PDF, images have specific signatures
-            if content[:4] == b'%PDF' or content[:8] == b'\x89PNG\r\n\x1a\n' or content[:2] == b'\xff\xd8':
+            head = content.read(100)
+            content.seek(0)
+            if head[:4] == b'%PDF' or head[:8] == b'\x89PNG\r\n\x1a\n' or head[:2] == b'\xff\xd8':
                 return content
             # Check if it looks like HTML (error response)
-            try:
-                if b'<!DOCTYPE' in content[:100] or b'<html' in content[:100].lower():
-                    logger.warning(f"Got HTML response instead of file for button {button_name}")
-                    return None
-            except:
-                pass
+            if b'<!DOCTYPE' in head or b'<html' in head.lower():
+                logger.warning(f"Got HTML response instead of file for button {button_name}")
+                content.close()
+                return None
             # Assume it's a valid file even if we can't identify the type
             return content
 
         return None
 
-    async def scrape_purchase(
+    async def _download_attachment(
         self,
-        chilecompra_code: str,
-        detail_url: str
+        session: aiohttp.ClientSession,
+        att: Dict[str, Any],
+        page_url: str,
+        form_fields: Dict[str, str]
+    ) -> Optional[Dict[str, Any]]:
+        """Download a single attachment via direct URL or postback, or None on failure"""
+        content = None
+
+        # Try direct URL first
+        if att.get('download_url'):
+            content = await self._fetch(
+                session,
+                att['download_url'],
+                binary=True
+            )
+
+        # Try postback if we have a button and no direct URL
+        elif att.get('postback_button') and form_fields:
+            logger.info(f"Downloading '{att['filename']}' via postback button: {att['postback_button']}")
+            content = await self._download_via_postback(
+                session,
+                page_url,
+                att['postback_button'],
+                form_fields
+            )
+
+        if not content:
+            logger.warning(f"Failed to download attachment: {att['filename']}")
+            return None
+
+        # Detect content type
+        content_type = 'application/octet-stream'
+        if att['filename'].lower().endswith('.pdf'):
+            content_type = 'application/pdf'
+        elif att['filename'].lower().endswith(('.jpg', '.jpeg')):
+            content_type = 'image/jpeg'
+        elif att['filename'].lower().endswith('.png'):
+            content_type = 'image/png'
+
+        size = file_size(content)
+        logger.info(f"Downloaded attachment: {att['filename']} ({size} bytes)")
+        return {
+            'filename': att['filename'],
+            'file_type': att.get('file_type'),
+            'date': att.get('date'),
+            'file': content,
+            'size': size,
+            'content_type': content_type
+        }
+
+    async def fetch_detail(self, detail_url: str) -> Optional[str]:
+        """
+        Fetch the DetailsPurchaseOrder.aspx page HTML.
+
+        Raises a non-transient ScrapeError if the page is gone (404/410).
+        """
+        session = await self._get_session()
+        logger.debug(f"Fetching detail page: {detail_url}")
+        return await self._request(
+            session, 'GET', detail_url, False,
+            permanent_statuses=(404, 410),
+            headers=self.headers
+        )
+
+    async def fetch_parsed_detail(self, detail_url: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch DetailsPurchaseOrder.aspx and parse it while it downloads.
+
+        Stops reading the page once onclick handlers have given both URLs.
+        Pages the incremental parser cannot handle, or where it finds
+        neither URL, have been read to the end by then and are parsed in
+        full (with the bs4 fallback) without another request. Pages sampled
+        for parser verification, which needs the whole HTML, are fetched
+        without streaming. Returns None if the page could not be fetched.
+        """
+        if self._sample_verify():
+            html = await self.fetch_detail(detail_url)
+            return await self._parse_detail_page(html, verify=True) if html else None
+
+        session = await self._get_session()
+        logger.debug(f"Fetching detail page (streaming): {detail_url}")
+        response = await self._request(
+            session, 'GET', detail_url, False,
+            permanent_statuses=(404, 410),
+            stream_parser=partial(DetailStreamParser, self.BASE_URL),
+            headers=self.headers
+        )
+        if response is None:
+            return None
+        result, html = response
+        if result and (result['pdf_report_url'] or result['attachments_url']):
+            logger.info(f"Parsed detail page - PDF: {result['pdf_report_url']}, Attachments: {result['attachments_url']}")
+            return result
+
+        # Only an early exit leaves html unset, and that needs both URLs
+        self.parse_stats['stream_fallback'] += 1
+        return await self._parse_detail_page(html, verify=False)
+
+    async def parse_detail(self, html: str) -> Dict[str, Any]:
+        """Extract the PDF report and attachments page URLs from detail page HTML"""
+        return await self._parse_detail_page(html)
+
+    async def download_documents(
+        self,
+        parsed: Dict[str, Any],
+        skip_pdf: bool = False,
+        skip_filenames: Optional[set] = None
     ) -> Dict[str, Any]:
         """
-        Complete scraping flow for a single purchase order.
+        Download the PDF report and all attachments referenced by a parsed detail page.
+
+        `skip_pdf` and `skip_filenames` leave out files that are already
+        stored (e.g. when resuming an interrupted run).
 
         Returns:
             {
-                'success': bool,
-                'error': str (if failed),
-                'pdf_report': bytes,
-                'pdf_report_url': str,
+                'pdf_report': file object or None,
                 'attachments': [
                     {
                         'filename': str,
                         'file_type': str,
-                        'content': bytes,
+                        'file': file object,
+                        'size': int,
                         'content_type': str
                     }
+                ],
+                'failed_attachments': [
+                    {'filename': str, 'file_type': str, 'date': str, 'error': str}
                 ]
             }
+
+        Call close_documents() once the files have been consumed.
         """
-        result = {
-            'success': False,
+        session = await self._get_session()
+        documents = {
             'pdf_report': None,
-            'pdf_report_url': None,
-            'attachments': []
+            'attachments': [],
+            'failed_attachments': []
         }
 
-        async with aiohttp.ClientSession() as session:
+        # Step 2: Download PDF report
+        if parsed.get('pdf_report_url') and not skip_pdf:
+            logger.debug(f"Downloading PDF report")
+            pdf_content = await self._fetch(
+                session,
+                parsed['pdf_report_url'],
+                binary=True
+            )
+            if pdf_content:
+                documents['pdf_report'] = pdf_content
+
+        # Steps 3-4: Attachments page and attachments
+        if parsed.get('attachments_url'):
             try:
-                # Step 1: Fetch detail page to get PDF link
-                logger.debug(f"Fetching detail page: {detail_url}")
-                detail_html = await self._fetch(session, detail_url)
-                if not detail_html:
-                    result['error'] = "Failed to fetch detail page"
-                    return result
-
-                parsed = self._parse_detail_page(detail_html)
-                result['pdf_report_url'] = parsed.get('pdf_report_url')
-
-                # Step 2: Download PDF report
-                if parsed.get('pdf_report_url'):
-                    logger.debug(f"Downloading PDF report")
-                    pdf_content = await self._fetch(
-                        session,
-                        parsed['pdf_report_url'],
-                        binary=True
-                    )
-                    if pdf_content:
-                        result['pdf_report'] = pdf_content
-
-                # Step 3: Fetch attachments page
-                if parsed.get('attachments_url'):
-                    logger.info(f"Fetching attachments page: {parsed['attachments_url']}")
-                    attachments_html = await self._fetch(session, parsed['attachments_url'])
-
-                    if attachments_html:
-                        attachment_list, form_fields = self._parse_attachments_page(attachments_html, parsed['attachments_url'])
-                        logger.info(f"Found {len(attachment_list)} attachments to download")
-
-                        # Step 4: Download each attachment
-                        for att in attachment_list:
-                            content = None
-
-                            # Try direct URL first
-                            if att.get('download_url'):
-                                content = await self._fetch(
-                                    session,
-                                    att['download_url'],
-                                    binary=True
-                                )
-
-                            # Try postback if we have a button and no direct URL
-                            elif att.get('postback_button') and form_fields:
-                                logger.info(f"Downloading '{att['filename']}' via postback button: {att['postback_button']}")
-                                content = await self._download_via_postback(
-                                    session,
-                                    parsed['attachments_url'],
-                                    att['postback_button'],
-                                    form_fields
-                                )
-
-                            if content:
-                                # Detect content type
-                                content_type = 'application/octet-stream'
-                                if att['filename'].lower().endswith('.pdf'):
-                                    content_type = 'application/pdf'
-                                elif att['filename'].lower().endswith(('.jpg', '.jpeg')):
-                                    content_type = 'image/jpeg'
-                                elif att['filename'].lower().endswith('.png'):
-                                    content_type = 'image/png'
-
-                                result['attachments'].append({
-                                    'filename': att['filename'],
-                                    'file_type': att.get('file_type'),
-                                    'date': att.get('date'),
-                                    'content': content,
-                                    'content_type': content_type
-                                })
-                                logger.info(f"Downloaded attachment: {att['filename']} ({len(content)} bytes)")
-                            else:
-                                logger.warning(f"Failed to download attachment: {att['filename']}")
-
-                result['success'] = True
+                downloaded, failed = await self._download_attachments_page(
+                    session,
+                    parsed['attachments_url'],
+                    skip=skip_filenames
+                )
+            except BaseException:
+                self.close_documents(documents)
+                raise
+            documents['attachments'] = downloaded
+            documents['failed_attachments'] = failed
+
+        return documents
+
+    async def download_attachments(
+        self,
+        attachments_url: str,
+        filenames: List[str]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Re-download only the named attachments from a stored attachments page URL.
 
-            except Exception as e:
-                result['error'] = str(e)
-                logger.error(f"Error scraping {chilecompra_code}: {e}")
+        The page is fetched again for fresh ASP.NET form fields, but the
+        detail page, PDF report and other attachments are not. Returns
+        (downloaded, failed) in the same shapes as download_documents;
+        a filename no longer listed on the page counts as failed.
+        """
+        session = await self._get_session()
+        return await self._download_attachments_page(session, attachments_url, set(filenames))
 
-        return result
+    async def _download_attachments_page(
+        self,
+        session: aiohttp.ClientSession,
+        attachments_url: str,
+        wanted: Optional[set] = None,
+        skip: Optional[set] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Fetch an attachments page and download its attachments (only `wanted`, never `skip`)"""
+        logger.info(f"Fetching attachments page: {attachments_url}")
+        attachments_html = await self._fetch(session, attachments_url)
+        if not attachments_html:
+            # Without the page we do not know which files are missing
+            raise ScrapeError("Failed to fetch attachments page")
+
+        attachment_list, form_fields = await self._parse_attachments_page(attachments_html, attachments_url)
+        failed = []
+        if wanted is not None:
+            listed = {att['filename'] for att in attachment_list}
+            attachment_list = [att for att in attachment_list if att['filename'] in wanted]
+            failed = [
+                {'filename': filename, 'error': "Not listed on attachments page"}
+                for filename in sorted(wanted - listed)
+            ]
+        if skip:
+            attachment_list = [att for att in attachment_list if att['filename'] not in skip]
+        logger.info(f"Found {len(attachment_list)} attachments to download")
+
+        # Download attachments concurrently (the concurrency and rate
+        # limiters still bound the actual request rate)
+        downloads = await asyncio.gather(*(
+            self._download_attachment(
+                session,
+                att,
+                attachments_url,
+                form_fields
+            )
+            for att in attachment_list
+        ))
+
+        downloaded = []
+        for att, download in zip(attachment_list, downloads):
+            if download:
+                downloaded.append(download)
+            else:
+                failed.append({
+                    'filename': att['filename'],
+                    'file_type': att.get('file_type'),
+                    'date': att.get('date'),
+                    'error': "Download failed"
+                })
+        return downloaded, failed
+
+    @staticmethod
+    def close_documents(documents: Dict[str, Any]):
+        """Close the spooled files held by a download_documents result"""
+        if documents.get('pdf_report'):
+            documents['pdf_report'].close()
+        for attachment in documents.get('attachments', []):
+            attachment['file'].close()
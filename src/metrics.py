@@ -0,0 +1,114 @@
+"""
+Lightweight timing and counter metrics for the run stats (scraper_state.json).
+"""
+
+import math
+from collections import defaultdict
+from typing import Any, Dict, Optional, Sequence
+
+# Upper bounds (seconds) of the latency histogram buckets; the last is open-ended
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum, min and max"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (max for the open bucket)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return self.max if math.isinf(bound) else bound
+        return self.max
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'total_seconds': round(self.total, 3),
+            'mean_seconds': round(self.total / self.count, 4) if self.count else None,
+            'min_seconds': round(self.min, 4) if self.min is not None else None,
+            'max_seconds': round(self.max, 4) if self.max is not None else None,
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'buckets': {
+                ('+Inf' if math.isinf(bound) else f"{bound:g}"): count
+                for bound, count in zip(self.buckets, self.counts)
+            }
+        }
+
+
+class QueryMetrics:
+    """
+    Per-kind latency histograms plus retry, backoff and byte counters for
+    one API client.
+
+    A "kind" is a label for what the request did (e.g. 'claim_scrapes' or
+    'flush'); its histogram measures the whole call including retries and
+    backoff, i.e. the wall-clock time the caller waited.
+    """
+
+    def __init__(self):
+        self.latency: Dict[str, Histogram] = defaultdict(Histogram)
+        self.statements: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.attempts = 0
+        self.retries: Dict[str, int] = defaultdict(int)
+        self.backoff_seconds = 0.0
+        self.gate_wait_seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def observe(self, kind: str, seconds: float, statements: int = 1, failed: bool = False):
+        """Record one finished call of `kind` that sent `statements` statements"""
+        self.latency[kind].observe(seconds)
+        self.statements[kind] += statements
+        if failed:
+            self.errors[kind] += 1
+
+    def retry(self, reason: str, backoff: float):
+        """Record a failed attempt that will be retried after `backoff` seconds"""
+        self.retries[reason] += 1
+        self.backoff_seconds += backoff
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(histogram.total for histogram in self.latency.values())
+        return {
+            'requests': sum(histogram.count for histogram in self.latency.values()),
+            'attempts': self.attempts,
+            'total_seconds': round(total, 3),
+            'retries': dict(self.retries),
+            'backoff_seconds': round(self.backoff_seconds, 3),
+            'gate_wait_seconds': round(self.gate_wait_seconds, 3),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'kinds': {
+                kind: {
+                    **histogram.stats(),
+                    'statements': self.statements[kind],
+                    'errors': self.errors[kind]
+                }
+                for kind, histogram in sorted(self.latency.items())
+            }
+        }
@@ -0,0 +1,629 @@
+"""
+HTML parsers for MercadoPublico detail and attachments pages.
+
+Two interchangeable backends share one extraction algorithm and differ only
+in how they walk the tree:
+
+    SoupParser  BeautifulSoup (lxml tree builder), the reference
+    LxmlParser  lxml.html with precompiled XPath, several times faster
+
+parse_page() runs a backend and falls back to BeautifulSoup when the lxml
+backend errors, finds nothing, or (when asked to verify) disagrees.
+DetailStreamParser reads a detail page chunk by chunk while it downloads
+and stops as soon as both URLs are known.
+Parsers are stateless module-level objects, so they can be used from
+worker threads or processes.
+"""
+
+import logging
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import lxml.html
+from bs4 import BeautifulSoup, Tag
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# ASP.NET hidden fields a postback has to send back
+ASPNET_FORM_FIELDS = (
+    '__VIEWSTATE',
+    '__VIEWSTATEGENERATOR',
+    '__EVENTVALIDATION',
+    '__EVENTTARGET',
+    '__EVENTARGUMENT',
+    '__PREVIOUSPAGE',
+    '__VIEWSTATEENCRYPTED',
+)
+
+ATTACHMENTS_PATH = "/Portal/Modules/Site/AdvancedSearch/ViewAttachmentPurchaseOrder.aspx"
+PDF_REPORT_DIR = "/PurchaseOrder/Modules/PO/"
+
+PDF_REPORT_RE = re.compile(r"'([^']*PDFReport\.aspx\?qs=[^']+)'")
+ATTACHMENTS_RE = re.compile(r"'([^']*ViewAttachmentPurchaseOrder[^']+)'")
+QS_RE = re.compile(r'\?qs=([^&\s]+)')
+ABSOLUTE_URL_RE = re.compile(r"'(https?://[^']+)'")
+RELATIVE_PDF_RE = re.compile(r"'(/[^']+\.pdf[^']*)'", re.IGNORECASE)
+
+HEADER_FILENAMES = ('nombre del anexo', 'nombre', 'anexo')
+
+
+def normalize_url(url: str) -> str:
+    """Normalize URL by resolving ../ and cleaning up the path"""
+    parsed = urlparse(url)
+
+    # If the path contains ../, we need to resolve it
+    if '/../' in parsed.path or parsed.path.startswith('../'):
+        # Split the path and resolve manually
+        parts = parsed.path.split('/')
+        resolved = []
+        for part in parts:
+            if part == '..':
+                if resolved and resolved[-1] != '':
+                    resolved.pop()
+            elif part == '.':
+                continue
+            else:
+                resolved.append(part)
+        normalized_path = '/'.join(resolved)
+        # Ensure path starts with /
+        if not normalized_path.startswith('/'):
+            normalized_path = '/' + normalized_path
+
+        if parsed.query:
+            return f"{parsed.scheme}://{parsed.netloc}{normalized_path}?{parsed.query}"
+        return f"{parsed.scheme}://{parsed.netloc}{normalized_path}"
+
+    return url
+
+
+def is_postback_button(name: str, element_id: str) -> bool:
+    """Whether an input[type=image] is an attachment download ('...$imgShow') button"""
+    return bool(name) and ('imgShow' in name or 'imgShow' in element_id or 'Show' in name)
+
+
+def _detail_onclick_urls(onclick: str, base_url: str) -> Dict[str, str]:
+    """PDF report / attachments page URLs an onclick handler of the detail page opens"""
+    urls = {}
+
+    # Pattern: open('PDFReport.aspx?qs=...' or window.open('...')
+    if 'PDFReport' in onclick:
+        match = PDF_REPORT_RE.search(onclick)
+        if match:
+            relative_url = match.group(1)
+            if relative_url.startswith('http'):
+                urls['pdf_report_url'] = relative_url
+            else:
+                urls['pdf_report_url'] = f"{base_url}{PDF_REPORT_DIR}{relative_url}"
+            logger.debug(f"Found PDF URL: {urls['pdf_report_url']}")
+
+    if 'ViewAttachmentPurchaseOrder' in onclick or 'Attachment' in onclick:
+        match = ATTACHMENTS_RE.search(onclick)
+        if match:
+            relative_url = match.group(1)
+            if relative_url.startswith('http'):
+                urls['attachments_url'] = relative_url
+            elif relative_url.startswith('/'):
+                urls['attachments_url'] = f"{base_url}{relative_url}"
+            elif 'ViewAttachmentPurchaseOrder.aspx' in relative_url:
+                # Relative paths like ../../../Portal/.../ViewAttachmentPurchaseOrder.aspx?qs=...
+                # keep only the qs parameter
+                qs_match = QS_RE.search(relative_url)
+                if qs_match:
+                    urls['attachments_url'] = f"{base_url}{ATTACHMENTS_PATH}?qs={qs_match.group(1)}"
+                else:
+                    urls['attachments_url'] = f"{base_url}{ATTACHMENTS_PATH}"
+            logger.debug(f"Found Attachments URL: {urls.get('attachments_url')}")
+
+    return urls
+
+
+def _complete_detail(result: Dict[str, Any], hrefs: Iterable[str], base_url: str) -> Dict[str, Any]:
+    """Fill URLs the onclick handlers did not give from <a href> links, then normalize"""
+    for href in hrefs:
+        if 'PDFReport' in href and not result['pdf_report_url']:
+            result['pdf_report_url'] = href if href.startswith('http') else urljoin(base_url, href)
+
+        if 'ViewAttachmentPurchaseOrder' in href and not result['attachments_url']:
+            result['attachments_url'] = href if href.startswith('http') else urljoin(base_url, href)
+
+    # Normalize URLs to resolve any ../ paths
+    if result['pdf_report_url']:
+        result['pdf_report_url'] = normalize_url(result['pdf_report_url'])
+    if result['attachments_url']:
+        result['attachments_url'] = normalize_url(result['attachments_url'])
+
+    return result
+
+
+class ParsedPage:
+    """
+    An HTML page parsed once with BeautifulSoup.
+
+    Form fields, tables and postback buttons are all read from the same
+    tree, so a large page (the attachments page carries a multi-hundred-KB
+    __VIEWSTATE) is never parsed twice.
+    """
+
+    def __init__(self, html: str):
+        self.soup = BeautifulSoup(html, 'lxml')
+        self._form_fields: Optional[Dict[str, str]] = None
+
+    def form_fields(self) -> Dict[str, str]:
+        """ASP.NET hidden form fields (__VIEWSTATE, __EVENTVALIDATION, ...)"""
+        if self._form_fields is None:
+            form_data = {}
+            seen = set()
+            # The first input with each name wins, as with soup.find() per name
+            for field in self.soup.find_all('input', attrs={'name': ASPNET_FORM_FIELDS}):
+                name = field.get('name')
+                if name in seen:
+                    continue
+                seen.add(name)
+                if field.get('value') is not None:
+                    form_data[name] = field.get('value', '')
+            self._form_fields = form_data
+        return dict(self._form_fields)
+
+    def tables(self) -> List[Tag]:
+        """All tables, nested ones included, in document order"""
+        return self.soup.find_all('table')
+
+    @staticmethod
+    def table_rows(table: Tag) -> List[Tag]:
+        """A table's own rows (directly or under its tbody), not those of nested tables"""
+        rows = table.find_all('tr', recursive=False)
+        if not rows:
+            tbody = table.find('tbody')
+            if tbody:
+                rows = tbody.find_all('tr', recursive=False)
+        return rows
+
+    @staticmethod
+    def postback_button(row: Tag) -> Optional[str]:
+        """Name of the row's input[type=image] download button ('...$imgShow'), if any"""
+        img_input = row.find('input', {'type': 'image'})
+        if img_input:
+            input_name = img_input.get('name', '')
+            if is_postback_button(input_name, img_input.get('id', '')):
+                return input_name
+        return None
+
+
+class PageParser(ABC):
+    """
+    Extraction logic shared by the backends.
+
+    Subclasses must implement the abstract tree primitives (_document,
+    _onclicks, _tables, ...); everything that decides what a URL or an
+    attachment is lives here, so both backends return identical dicts for
+    the same tree.
+    """
+
+    name = 'base'
+
+    def parse_detail(self, html: str, base_url: str) -> Dict[str, Any]:
+        """
+        Find the PDF report and attachments page URLs on DetailsPurchaseOrder.aspx.
+
+        onclick handlers are checked first (later matches win), then <a href>
+        links fill in whatever is still missing.
+        """
+        doc = self._document(html)
+        result = {
+            'pdf_report_url': None,
+            'attachments_url': None,
+        }
+
+        for onclick in self._onclicks(doc):
+            result.update(_detail_onclick_urls(onclick, base_url))
+
+        return _complete_detail(result, self._link_hrefs(doc), base_url)
+
+    def parse_attachments(
+        self,
+        html: str,
+        page_url: str,
+        base_url: str
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        """
+        Parse ViewAttachmentPurchaseOrder.aspx into (attachments, ASP.NET form fields).
+
+        Expected structure:
+        | Nombre del Anexo | Tipo | Fecha | Ver |
+        | COT_xxx.pdf | Cotizacion | 23-06-2025 | [input button] |
+        """
+        doc = self._document(html)
+        attachments = []
+        seen_buttons = set()  # Postback buttons already seen via a nested table
+
+        for table in self._tables(doc):
+            # Only direct rows, to avoid nested table dupes
+            for row in self._rows(table):
+                cells = self._cells(row)
+                if len(cells) < 3:
+                    continue
+
+                filename = self._text(cells[0])
+                file_type = self._text(cells[1])
+                date = self._text(cells[2])
+
+                # Skip header-like rows or empty rows
+                if not filename or filename.lower() in HEADER_FILENAMES:
+                    continue
+
+                # Validate filename looks like a file (has extension)
+                if '.' not in filename or len(filename) > 100:
+                    continue
+
+                # Look for download link - could be <a>, onclick, or ASP.NET postback button
+                download_url = None
+                postback_button = None
+
+                # Method 1: first <a href> of a cell, unless it is javascript:
+                for cell in cells:
+                    href = self._first_href(cell)
+                    if href and not href.startswith('javascript'):
+                        download_url = urljoin(page_url, href)
+                        break
+
+                # Method 2: an onclick handler with an absolute or relative PDF URL
+                if not download_url:
+                    for cell in cells:
+                        for onclick in self._cell_onclicks(cell):
+                            url_match = ABSOLUTE_URL_RE.search(onclick)
+                            if url_match:
+                                download_url = url_match.group(1)
+                                break
+                            url_match = RELATIVE_PDF_RE.search(onclick)
+                            if url_match:
+                                download_url = f"{base_url}{url_match.group(1)}"
+                                break
+
+                # Method 3: an ASP.NET postback button; downloading it means
+                # posting the form back with the button's coordinates
+                if not download_url:
+                    input_name = self._postback_button(row)
+                    if input_name:
+                        if input_name in seen_buttons:
+                            continue
+                        postback_button = input_name
+                        seen_buttons.add(input_name)
+
+                if download_url or postback_button:
+                    attachments.append({
+                        'filename': filename,
+                        'file_type': file_type,
+                        'date': date,
+                        'download_url': download_url,
+                        'postback_button': postback_button
+                    })
+                    logger.debug(f"Found attachment: {filename} -> {download_url or postback_button}")
+                elif filename.endswith('.pdf') or filename.endswith('.PDF'):
+                    logger.warning(f"Found attachment '{filename}' but no download URL or postback button")
+
+        return attachments, self._form_fields(doc)
+
+    def form_fields(self, html: str) -> Dict[str, str]:
+        """ASP.NET hidden form fields of a page"""
+        return self._form_fields(self._document(html))
+
+    # Tree primitives, implemented by each backend
+
+    @abstractmethod
+    def _document(self, html: str):
+        """Parse the page into this backend's tree"""
+
+    @abstractmethod
+    def _onclicks(self, doc) -> Iterator[str]:
+        """onclick values of all elements, in document order"""
+
+    @abstractmethod
+    def _link_hrefs(self, doc) -> Iterator[str]:
+        """href values of all <a href> links, in document order"""
+
+    @abstractmethod
+    def _form_fields(self, doc) -> Dict[str, str]:
+        """ASP.NET hidden form fields; the first input with each name wins"""
+
+    @abstractmethod
+    def _tables(self, doc) -> list:
+        """All tables, nested ones included, in document order"""
+
+    @abstractmethod
+    def _rows(self, table) -> list:
+        """A table's own rows (directly or under its tbody), not those of nested tables"""
+
+    @abstractmethod
+    def _cells(self, row) -> list:
+        """A row's own <td> cells"""
+
+    @abstractmethod
+    def _text(self, cell) -> str:
+        """Stripped text strings of a cell joined without separator (get_text(strip=True))"""
+
+    @abstractmethod
+    def _first_href(self, cell) -> Optional[str]:
+        """href of the first <a href> inside a cell, if any"""
+
+    @abstractmethod
+    def _cell_onclicks(self, cell) -> Iterator[str]:
+        """onclick values of all elements inside a cell, in document order"""
+
+    @abstractmethod
+    def _postback_button(self, row) -> Optional[str]:
+        """Name of the row's input[type=image] download button, if any"""
+
+
+class SoupParser(PageParser):
+    """Reference backend on BeautifulSoup"""
+
+    name = 'bs4'
+
+    def _document(self, html: str) -> ParsedPage:
+        return ParsedPage(html)
+
+    def _onclicks(self, doc: ParsedPage) -> Iterator[str]:
+        for elem in doc.soup.find_all(attrs={'onclick': True}):
+            yield elem.get('onclick', '')
+
+    def _link_hrefs(self, doc: ParsedPage) -> Iterator[str]:
+        for link in doc.soup.find_all('a', href=True):
+            yield link.get('href', '')
+
+    def _form_fields(self, doc: ParsedPage) -> Dict[str, str]:
+        return doc.form_fields()
+
+    def _tables(self, doc: ParsedPage) -> list:
+        return doc.tables()
+
+    def _rows(self, table: Tag) -> list:
+        return ParsedPage.table_rows(table)
+
+    def _cells(self, row: Tag) -> list:
+        return row.find_all('td', recursive=False)
+
+    def _text(self, cell: Tag) -> str:
+        return cell.get_text(strip=True)
+
+    def _first_href(self, cell: Tag) -> Optional[str]:
+        link = cell.find('a', href=True)
+        return link.get('href', '') if link else None
+
+    def _cell_onclicks(self, cell: Tag) -> Iterator[str]:
+        for elem in cell.find_all(attrs={'onclick': True}):
+            yield elem.get('onclick', '')
+
+    def _postback_button(self, row: Tag) -> Optional[str]:
+        return ParsedPage.postback_button(row)
+
+
+class LxmlParser(PageParser):
+    """Fast backend on lxml.html with precompiled XPath"""
+
+    name = 'lxml'
+
+    # Strings inside these never count as text for BeautifulSoup's get_text()
+    NON_TEXT_TAGS = frozenset(('script', 'style', 'template', 'rt', 'rp'))
+
+    _onclick_xpath = etree.XPath('//*[@onclick]/@onclick')
+    _href_xpath = etree.XPath('//a[@href]/@href')
+    _form_field_xpath = etree.XPath(
+        '//input[' + ' or '.join(f'@name="{name}"' for name in ASPNET_FORM_FIELDS) + ']'
+    )
+    _tables_xpath = etree.XPath('//table')
+    _direct_rows_xpath = etree.XPath('./tr')
+    _tbody_xpath = etree.XPath('.//tbody')
+    _cells_xpath = etree.XPath('./td')
+    _first_href_xpath = etree.XPath('(.//a[@href])[1]/@href')
+    _cell_onclicks_xpath = etree.XPath('.//*[@onclick]/@onclick')
+    _image_input_xpath = etree.XPath('(.//input[@type="image"])[1]')
+
+    def _document(self, html: str):
+        return lxml.html.document_fromstring(html)
+
+    def _onclicks(self, doc) -> Iterator[str]:
+        return iter(self._onclick_xpath(doc))
+
+    def _link_hrefs(self, doc) -> Iterator[str]:
+        return iter(self._href_xpath(doc))
+
+    def _form_fields(self, doc) -> Dict[str, str]:
+        form_data = {}
+        seen = set()
+        for field in self._form_field_xpath(doc):
+            name = field.get('name')
+            if name in seen:
+                continue
+            seen.add(name)
+            value = field.get('value')
+            if value is not None:
+                form_data[name] = value
+        return form_data
+
+    def _tables(self, doc) -> list:
+        return self._tables_xpath(doc)
+
+    def _rows(self, table) -> list:
+        rows = self._direct_rows_xpath(table)
+        if not rows:
+            tbody = self._tbody_xpath(table)
+            if tbody:
+                rows = self._direct_rows_xpath(tbody[0])
+        return rows
+
+    def _cells(self, row) -> list:
+        return self._cells_xpath(row)
+
+    def _text(self, cell) -> str:
+        parts = []
+        self._collect_text(cell, parts)
+        return ''.join(parts)
+
+    def _collect_text(self, element, parts: List[str]):
+        # Comments and processing instructions have non-string tags; like
+        # script/style their own text is skipped but their tail is not
+        if isinstance(element.tag, str) and element.tag not in self.NON_TEXT_TAGS:
+            if element.text:
+                text = element.text.strip()
+                if text:
+                    parts.append(text)
+            for child in element:
+                self._collect_text(child, parts)
+                if child.tail:
+                    tail = child.tail.strip()
+                    if tail:
+                        parts.append(tail)
+
+    def _first_href(self, cell) -> Optional[str]:
+        hrefs = self._first_href_xpath(cell)
+        return hrefs[0] if hrefs else None
+
+    def _cell_onclicks(self, cell) -> Iterator[str]:
+        return iter(self._cell_onclicks_xpath(cell))
+
+    def _postback_button(self, row) -> Optional[str]:
+        inputs = self._image_input_xpath(row)
+        if inputs:
+            input_name = inputs[0].get('name', '')
+            if is_postback_button(input_name, inputs[0].get('id', '')):
+                return input_name
+        return None
+
+
+class DetailStreamParser:
+    """
+    Incremental detail page parser fed with chunks of the response body.
+
+    Walks elements as lxml's pull parser emits them and applies the same
+    rules as PageParser.parse_detail(). feed() returns True as soon as
+    onclick handlers have given both URLs, after which the rest of the page
+    (ViewState, line-item tables) never needs to be read. Elements are
+    cleared once parsed, so memory stays flat while reading a full page.
+
+    The one difference from a full parse: when a page has several onclick
+    handlers for the same URL, the full parse keeps the last one and an
+    early exit keeps the first.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.result: Dict[str, Any] = {
+            'pdf_report_url': None,
+            'attachments_url': None,
+        }
+        self.done = False
+        self.failed = False
+        self._from_onclick = set()
+        # Only the first matching href per URL can be used by _complete_detail
+        self._hrefs: Dict[str, str] = {}
+        self._parser = etree.HTMLPullParser(events=('start', 'end'))
+
+    def feed(self, text: str) -> bool:
+        """Parse the next chunk; True once no more input is needed"""
+        if self.done:
+            return True
+        try:
+            self._parser.feed(text)
+            self._read_events()
+        except Exception as e:
+            logger.warning(f"Incremental detail parse failed: {e}")
+            self.failed = self.done = True
+        return self.done
+
+    def close(self) -> Optional[Dict[str, Any]]:
+        """The parse result, or None if the page could not be parsed"""
+        if not self.done:
+            try:
+                self._parser.close()
+                self._read_events()
+            except Exception as e:
+                logger.warning(f"Incremental detail parse failed: {e}")
+                self.failed = True
+        if self.failed:
+            return None
+        return _complete_detail(dict(self.result), self._hrefs.values(), self.base_url)
+
+    def _read_events(self):
+        for event, element in self._parser.read_events():
+            if event == 'end':
+                element.clear(keep_tail=True)
+                continue
+
+            onclick = element.get('onclick')
+            if onclick is not None:
+                urls = _detail_onclick_urls(onclick, self.base_url)
+                self.result.update(urls)
+                self._from_onclick.update(urls)
+                if len(self._from_onclick) == 2:
+                    self.done = True
+                    return
+
+            if element.tag == 'a':
+                href = element.get('href')
+                if href is not None:
+                    if 'PDFReport' in href:
+                        self._hrefs.setdefault('pdf_report_url', href)
+                    if 'ViewAttachmentPurchaseOrder' in href:
+                        self._hrefs.setdefault('attachments_url', href)
+
+
+PARSERS: Dict[str, PageParser] = {
+    SoupParser.name: SoupParser(),
+    LxmlParser.name: LxmlParser(),
+}
+
+
+def get_parser(name: str) -> PageParser:
+    """Parser backend by name ('lxml' or 'bs4')"""
+    try:
+        return PARSERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown parser backend '{name}' (choose from {', '.join(PARSERS)})")
+
+
+def _looks_empty(kind: str, html: str, result) -> bool:
+    """A result that a page with this content should not produce"""
+    if kind == 'detail':
+        return not (result['pdf_report_url'] or result['attachments_url'])
+    attachments, _ = result
+    return not attachments and 'imgShow' in html
+
+
+def parse_page(
+    kind: str,
+    html: str,
+    *args,
+    backend: str = 'lxml',
+    verify: bool = False
+) -> Tuple[Any, Optional[str]]:
+    """
+    Parse a 'detail' or 'attachments' page with `backend`.
+
+    Falls back to BeautifulSoup when the backend raises, returns nothing
+    for a page that clearly has content, or (with `verify`) returns
+    something different from BeautifulSoup. Returns (result, event) where
+    event is None, 'verified', 'error', 'empty' or 'divergence'.
+    """
+    parser = get_parser(backend)
+    method = 'parse_detail' if kind == 'detail' else 'parse_attachments'
+    reference = PARSERS[SoupParser.name]
+    if parser is reference:
+        return getattr(parser, method)(html, *args), None
+
+    try:
+        result = getattr(parser, method)(html, *args)
+    except Exception as e:
+        logger.warning(f"{backend} parser failed on {kind} page ({e}), using bs4")
+        return getattr(reference, method)(html, *args), 'error'
+
+    if not verify and not _looks_empty(kind, html, result):
+        return result, None
+
+    expected = getattr(reference, method)(html, *args)
+    if result == expected:
+        return result, 'verified' if verify else None
+    logger.warning(f"{backend} parser diverged from bs4 on {kind} page, using bs4")
+    return expected, 'divergence' if verify else 'empty'
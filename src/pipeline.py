@@ -0,0 +1,108 @@
+"""
+Staged producer/consumer pipeline built on bounded asyncio queues.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# A stage handler receives a job and returns the job to pass downstream
+StageHandler = Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class Stage:
+    """One pipeline step with its own worker count"""
+
+    def __init__(self, name: str, handler: StageHandler, workers: int = 1):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+
+        # Per-stage counters, useful for tuning worker counts
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'processed': self.processed,
+            'failed': self.failed,
+            'busy_seconds': round(self.busy_seconds, 2)
+        }
+
+
+class Pipeline:
+    """
+    Run jobs through a chain of stages connected by bounded queues.
+
+    Each stage pulls from its own queue of size `queue_depth`, so a slow
+    stage applies backpressure to the ones before it. If a handler raises,
+    the job gets `error`, `exception` and `failed_stage` keys and skips
+    straight to the last stage, which is expected to record the outcome of
+    every job.
+    """
+
+    def __init__(self, stages: List[Stage], queue_depth: int = 10):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        self.queue_depth = queue_depth
+
+    async def run(self, jobs: Iterable[Dict[str, Any]]):
+        """Feed jobs into the first stage and wait until every stage is drained"""
+        queues = [asyncio.Queue(maxsize=self.queue_depth) for _ in self.stages]
+
+        workers = []
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                workers.append(asyncio.create_task(self._worker(index, queues)))
+
+        try:
+            for job in jobs:
+                await queues[0].put(job)
+
+            # A job only leaves a queue after it was put on a later one,
+            # so joining the queues in order drains the whole pipeline
+            for queue in queues:
+                await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(self, index: int, queues: List[asyncio.Queue]):
+        stage = self.stages[index]
+        is_last = index == len(self.stages) - 1
+
+        while True:
+            job = await queues[index].get()
+            started = time.monotonic()
+            try:
+                try:
+                    result = await stage.handler(job)
+                    stage.processed += 1
+                except Exception as e:
+                    stage.failed += 1
+                    if is_last:
+                        logger.error(f"Stage '{stage.name}' failed: {e}", exc_info=True)
+                        continue
+                    job['error'] = str(e)
+                    job['exception'] = e
+                    job['failed_stage'] = stage.name
+                    await queues[-1].put(job)
+                    continue
+                finally:
+                    stage.busy_seconds += time.monotonic() - started
+
+                if result is not None and not is_last:
+                    await queues[index + 1].put(result)
+            finally:
+                queues[index].task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-stage counters keyed by stage name"""
+        return {stage.name: stage.stats() for stage in self.stages}
@@ -2,13 +2,20 @@
 Cloudflare R2 client for file uploads.
 """
 
+import asyncio
 import boto3
 import json
 import logging
-from typing import Any
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import IO, Any, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
+# R2 (like S3) rejects multipart parts smaller than 5 MiB, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
 
 class R2Client:
     """Client for Cloudflare R2 storage (S3-compatible)"""
@@ -18,17 +25,43 @@ class R2Client:
         account_id: str,
         access_key: str,
         secret_key: str,
-        bucket: str
+        bucket: str,
+        max_workers: int = 8,
+        multipart_threshold: int = 16 * 1024 * 1024,
+        part_size: int = 8 * 1024 * 1024,
+        part_concurrency: int = 4,
+        part_retries: int = 3
     ):
         self.bucket = bucket
+        self.max_workers = max_workers
+        self.multipart_threshold = multipart_threshold
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.part_concurrency = part_concurrency
+        self.part_retries = part_retries
         self.s3 = boto3.client(
             's3',
             endpoint_url=f"https://{account_id}.r2.cloudflarestorage.com",
             aws_access_key_id=access_key,
             aws_secret_access_key=secret_key,
-            region_name='auto'
+            region_name='auto',
+            # One pooled connection per worker thread so no thread waits on the pool
+            config=Config(max_pool_connections=max_workers)
+        )
+        # boto3 is blocking, so all S3 calls run here instead of on the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='r2'
         )
 
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking boto3 call in the R2 thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def close(self):
+        """Wait for pending uploads and shut down the thread pool"""
+        self._executor.shutdown(wait=True)
+
     async def upload_bytes(
         self,
         key: str,
@@ -37,7 +70,8 @@ class R2Client:
     ):
         """Upload binary data to R2"""
         try:
-            self.s3.put_object(
+            await self._run(
+                self.s3.put_object,
                 Bucket=self.bucket,
                 Key=key,
                 Body=data,
@@ -48,15 +82,160 @@ class R2Client:
             logger.error(f"Failed to upload {key}: {e}")
             raise
 
+    async def upload_file(
+        self,
+        key: str,
+        fileobj: IO[bytes],
+        content_type: str = 'application/octet-stream'
+    ):
+        """
+        Upload a seekable file object to R2 without reading it into memory.
+
+        Files of at least `multipart_threshold` bytes go through a multipart
+        upload; smaller ones use a single put_object.
+        """
+        fileobj.seek(0, 2)
+        size = fileobj.tell()
+        fileobj.seek(0)
+
+        if size >= self.multipart_threshold:
+            await self._upload_multipart(key, fileobj, content_type)
+            return
+
+        try:
+            await self._run(
+                self.s3.put_object,
+                Bucket=self.bucket,
+                Key=key,
+                Body=fileobj,
+                ContentType=content_type
+            )
+            logger.debug(f"Uploaded: {key} ({size} bytes)")
+        except Exception as e:
+            logger.error(f"Failed to upload {key}: {e}")
+            raise
+
+    async def _upload_multipart(
+        self,
+        key: str,
+        fileobj: IO[bytes],
+        content_type: str
+    ):
+        """
+        Upload a file in `part_size` parts, `part_concurrency` at a time.
+
+        Parts are read from the file only when an upload slot is free, so at
+        most part_concurrency parts are buffered. Each part is retried on its
+        own; if any part still fails the whole upload is aborted on R2.
+        """
+        upload = await self._run(
+            self.s3.create_multipart_upload,
+            Bucket=self.bucket,
+            Key=key,
+            ContentType=content_type
+        )
+        upload_id = upload['UploadId']
+        slots = asyncio.Semaphore(self.part_concurrency)
+        tasks = []
+
+        try:
+            part_number = 1
+            while True:
+                await slots.acquire()
+
+                # Stop reading as soon as an earlier part has failed for good
+                for task in tasks:
+                    if task.done() and task.exception():
+                        slots.release()
+                        raise task.exception()
+
+                chunk = await self._run(fileobj.read, self.part_size)
+                if not chunk:
+                    slots.release()
+                    break
+                tasks.append(asyncio.create_task(
+                    self._upload_part(key, upload_id, part_number, chunk, slots)
+                ))
+                part_number += 1
+
+            parts = await asyncio.gather(*tasks)
+            await self._run(
+                self.s3.complete_multipart_upload,
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+            logger.debug(f"Uploaded: {key} ({len(parts)} parts)")
+
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.error(f"Failed multipart upload {key}: {e}")
+            try:
+                await self._run(
+                    self.s3.abort_multipart_upload,
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id
+                )
+            except Exception as abort_error:
+                logger.error(f"Failed to abort multipart upload {key}: {abort_error}")
+            raise
+
+    async def _upload_part(
+        self,
+        key: str,
+        upload_id: str,
+        part_number: int,
+        data: bytes,
+        slots: asyncio.Semaphore
+    ) -> Dict[str, Any]:
+        """Upload one part with its own retries, then free its slot"""
+        try:
+            for attempt in range(self.part_retries):
+                try:
+                    response = await self._run(
+                        self.s3.upload_part,
+                        Bucket=self.bucket,
+                        Key=key,
+                        UploadId=upload_id,
+                        PartNumber=part_number,
+                        Body=data
+                    )
+                    return {'ETag': response['ETag'], 'PartNumber': part_number}
+                except Exception as e:
+                    if attempt == self.part_retries - 1:
+                        raise
+                    delay = 2 ** attempt
+                    logger.warning(
+                        f"Part {part_number} of {key} failed: {e}, retrying in {delay}s "
+                        f"(attempt {attempt + 1}/{self.part_retries})"
+                    )
+                    await asyncio.sleep(delay)
+        finally:
+            slots.release()
+
     async def upload_json(self, key: str, data: Any):
         """Upload JSON data to R2"""
         json_bytes = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
         await self.upload_bytes(key, json_bytes, 'application/json')
 
+    async def download_bytes(self, key: str) -> Optional[bytes]:
+        """Download an object from R2, or None if it does not exist"""
+        def get():
+            try:
+                response = self.s3.get_object(Bucket=self.bucket, Key=key)
+            except self.s3.exceptions.NoSuchKey:
+                return None
+            return response['Body'].read()
+        return await self._run(get)
+
     async def file_exists(self, key: str) -> bool:
         """Check if a file exists in R2"""
         try:
-            self.s3.head_object(Bucket=self.bucket, Key=key)
+            await self._run(self.s3.head_object, Bucket=self.bucket, Key=key)
             return True
         except self.s3.exceptions.ClientError:
             return False
@@ -64,7 +243,7 @@ class R2Client:
     async def delete_file(self, key: str):
         """Delete a file from R2"""
         try:
-            self.s3.delete_object(Bucket=self.bucket, Key=key)
+            await self._run(self.s3.delete_object, Bucket=self.bucket, Key=key)
             logger.debug(f"Deleted: {key}")
         except Exception as e:
             logger.error(f"Failed to delete {key}: {e}")
@@ -0,0 +1,327 @@
+"""
+Rate and concurrency limiting primitives shared by the HTTP clients.
+"""
+
+import asyncio
+import logging
+import random
+from typing import Any, Dict
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket that spaces requests to a target rate.
+
+    Callers reserve a token synchronously and then sleep until it is due,
+    so waiting never holds a lock or a concurrency slot. `jitter` adds up
+    to that fraction of one token interval of random delay per request.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, jitter: float = 0.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.jitter = jitter
+        self._tokens = float(self.burst)
+        self._updated = None
+
+    def _reserve(self) -> float:
+        """Take one token and return how long the caller must wait for it"""
+        now = asyncio.get_running_loop().time()
+        if self._updated is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        # Tokens may go negative: each waiter owns a later slot in the schedule
+        self._tokens -= 1
+        wait = max(0.0, -self._tokens / self.rate)
+        if self.jitter:
+            wait += random.uniform(0, self.jitter / self.rate)
+        return wait
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class HostRateLimiter:
+    """One TokenBucket per host, created on first use"""
+
+    def __init__(self, rate: float, burst: int = 1, jitter: float = 0.0):
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst, self.jitter)
+        return self._buckets[host]
+
+    async def acquire(self, url: str):
+        """Wait until a request to the URL's host may be sent"""
+        await self.bucket(url).acquire()
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit shared by all workers.
+
+    Every healthy response grows the limit by `increase / limit` (about
+    +increase per full window of requests). A 429, 5xx, timeout or a
+    latency spike multiplies it by `decrease`, at most once per `cooldown`
+    seconds, so a burst of failures from one window only counts once.
+
+    Latency is tracked per request `kind` (e.g. method and path), since a
+    small detail page and a large attachments page have very different
+    normal latencies. A spike is a smoothed latency above
+    `latency_tolerance` times the kind's baseline and at least
+    `latency_floor` seconds above it, so millisecond jitter on a very fast
+    endpoint never counts as a spike. The baseline follows
+    new lows at once and drifts up towards the smoothed latency by
+    `latency_baseline_decay` per response, so one unusually fast response
+    cannot set it for the rest of the run. For its first
+    `latency_min_samples` responses a kind only warms up its baseline and
+    never signals a spike.
+
+    Use as `async with limiter:` around the request itself, and report
+    the outcome with on_success() / on_overload() inside the block.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        cooldown: float = 2.0,
+        latency_tolerance: float = 3.0,
+        latency_floor: float = 0.25,
+        latency_baseline_decay: float = 0.05,
+        latency_min_samples: int = 5
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(max_limit or initial, self.min_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.latency_tolerance = latency_tolerance
+        self.latency_floor = latency_floor
+        self.latency_baseline_decay = latency_baseline_decay
+        self.latency_min_samples = latency_min_samples
+
+        self.peak_limit = self.limit
+        self.low_limit = self.limit
+        self.increases = 0
+        self.decreases = 0
+
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+        # Pending wake-ups scheduled by _notify(), kept until they have run
+        self._notifications: set = set()
+        self._last_decrease = None
+        # kind -> [smoothed latency, baseline, samples]
+        self._latency: Dict[str, list] = {}
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _notify(self):
+        # Wake waiters after a limit increase; scheduled so sync callers can use it
+        async def notify():
+            async with self._condition:
+                self._condition.notify_all()
+        task = asyncio.get_running_loop().create_task(notify())
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
+
+    def on_success(self, latency: float = None, kind: str = 'default'):
+        """Record a healthy response; `latency` (seconds) of a `kind` of request is optional"""
+        if latency is not None and self._latency_spiked(latency, kind):
+            self.on_overload('latency')
+            return
+
+        previous = int(self.limit)
+        self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+        if int(self.limit) > previous:
+            self.increases += 1
+            self.peak_limit = max(self.peak_limit, self.limit)
+            logger.debug(f"Concurrency limit raised to {int(self.limit)}")
+            self._notify()
+
+    def on_overload(self, reason: str = 'overload'):
+        """Record a 429, 5xx, timeout or latency spike"""
+        now = asyncio.get_running_loop().time()
+        if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self.low_limit = min(self.low_limit, self.limit)
+        self.decreases += 1
+        logger.warning(f"Concurrency limit cut to {int(self.limit)} ({reason})")
+
+    def _latency_spiked(self, latency: float, kind: str) -> bool:
+        """Compare the kind's smoothed latency with its decaying baseline"""
+        state = self._latency.get(kind)
+        if state is None:
+            self._latency[kind] = [latency, latency, 1]
+            return False
+
+        ewma = 0.8 * state[0] + 0.2 * latency
+        samples = state[2] + 1
+        baseline = state[1]
+        if ewma < baseline or samples <= self.latency_min_samples:
+            # While warming up the baseline simply follows the smoothed latency
+            baseline = ewma
+        else:
+            baseline += self.latency_baseline_decay * (ewma - baseline)
+        state[:] = [ewma, baseline, samples]
+        return (
+            samples > self.latency_min_samples
+            and ewma > baseline * self.latency_tolerance
+            and ewma - baseline > self.latency_floor
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'current_limit': int(self.limit),
+            'peak_limit': int(self.peak_limit),
+            'low_limit': int(self.low_limit),
+            'max_limit': self.max_limit,
+            'increases': self.increases,
+            'decreases': self.decreases
+        }
+
+
+class CircuitBreaker:
+    """
+    Client-wide circuit breaker with a shared pause gate.
+
+    Every request calls `await wait()` first (and release_probe() afterwards
+    if wait() returned True). After `failure_threshold`
+    consecutive failures the circuit opens and callers wait `reset_timeout`
+    seconds; then one caller is let through as a half-open probe. Its
+    success closes the circuit and releases everyone, a failure reopens it.
+
+    pause() delays every caller until a deadline, e.g. when one request
+    sees a Retry-After header.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, name: str = 'circuit'):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+
+        self.state = self.CLOSED
+        self.times_opened = 0
+        self.pauses = 0
+
+        self._failures = 0
+        self._opened_at = 0.0
+        self._paused_until = 0.0
+        self._probe_in_flight = False
+        self._changed = asyncio.Event()
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"{self.name}: circuit {self.state} -> {state}")
+            self.state = state
+        # Wake everyone waiting so they re-check the new state
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _sleep_or_change(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def wait(self) -> bool:
+        """Wait until a request may be sent; returns True if it is the half-open probe"""
+        while True:
+            now = self._now()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    await self._sleep_or_change(remaining)
+                    continue
+                self._set_state(self.HALF_OPEN)
+
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    await self._sleep_or_change(self.reset_timeout)
+                    continue
+                self._probe_in_flight = True
+                return True
+
+            return False
+
+    def pause(self, delay: float):
+        """Hold back all callers for `delay` seconds from now"""
+        until = self._now() + delay
+        if until > self._paused_until:
+            self._paused_until = until
+            self.pauses += 1
+
+    def record_success(self):
+        self._failures = 0
+        self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED and self._failures >= self.failure_threshold
+        ):
+            self._opened_at = self._now()
+            self.times_opened += 1
+            self._set_state(self.OPEN)
+
+    def release_probe(self):
+        """Called by the probe when done; lets another caller probe if it recorded no outcome"""
+        if self.state == self.HALF_OPEN and self._probe_in_flight:
+            self._probe_in_flight = False
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'times_opened': self.times_opened,
+            'pauses': self.pauses
+        }
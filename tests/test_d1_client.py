@@ -0,0 +1,296 @@
+"""
+D1Client against the local SQLite stand-in (src/d1_local.py).
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from src.d1_client import D1Client
+from src.d1_local import LocalD1Server
+
+
+@asynccontextmanager
+async def local_d1(scrapes: int = 0, **options):
+    """A LocalD1Server seeded with `scrapes` pending rows and a client for it"""
+    async with LocalD1Server(seed=0) as server:
+        server.seed_scrapes(scrapes)
+        options = {
+            'max_retries': 1,
+            'base_delay': 0.0,
+            'flush_interval': 3600.0,
+            'breaker_threshold': 1000,
+            **options
+        }
+        client = D1Client('account', 'token', 'database', api_base=server.api_base, **options)
+        try:
+            yield server, client
+        finally:
+            await client.close()
+
+
+def rows(server: LocalD1Server, sql: str, params: tuple = ()) -> list:
+    return [dict(row) for row in server.db.execute(sql, params).fetchall()]
+
+
+def ago(seconds: float) -> str:
+    """An ISO timestamp `seconds` in the past (negative: in the future)"""
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+
+
+def set_row(server: LocalD1Server, scrape_id: int, **columns):
+    assignments = ', '.join(f"{name} = ?" for name in columns)
+    server.db.execute(
+        f"UPDATE document_scrapes SET {assignments} WHERE id = ?",
+        [*columns.values(), scrape_id]
+    )
+    server.db.commit()
+
+
+def commit(scrape_id: int, attachments: int = 1) -> dict:
+    return {
+        'scrape_id': scrape_id,
+        'r2_folder': f"raw/LOCAL-{scrape_id}-AG25/",
+        'attachment_count': attachments,
+        'total_file_size': 100 * attachments,
+        'attachments': [
+            {
+                'filename': f"file_{i}.pdf",
+                'file_type': 'pdf',
+                'r2_key': f"raw/LOCAL-{scrape_id}-AG25/file_{i}.pdf",
+                'file_size': 100
+            }
+            for i in range(attachments)
+        ]
+    }
+
+
+def test_backpressure_keeps_commits_queued_while_d1_fails():
+    async def scenario():
+        async with local_d1(scrapes=8, flush_size=2) as (server, client):
+            server.error_rate = 1.0
+            # The 8th commit hits flush_size * 4 and waits for a flush that fails
+            for scrape_id in range(1, 9):
+                await client.queue_commit(commit(scrape_id))
+            await asyncio.gather(*client._background_flushes)
+
+            assert server.stats['server_errors'] > 0
+            assert sorted(client._pending) == list(range(1, 9))
+            assert rows(server, "SELECT COUNT(*) AS n FROM attachments") == [{'n': 0}]
+
+            server.error_rate = 0.0
+            await client.flush()
+
+            assert client._pending == {}
+            assert rows(server, "SELECT DISTINCT scrape_status FROM document_scrapes") == [
+                {'scrape_status': 'scraped'}
+            ]
+            assert rows(server, "SELECT COUNT(*) AS n FROM attachments") == [{'n': 8}]
+
+    asyncio.run(scenario())
+
+
+def test_claim_by_codes_takes_any_number_of_codes_in_one_statement():
+    async def scenario():
+        async with local_d1(scrapes=150) as (server, client):
+            codes = [f"LOCAL-{i}-AG25" for i in range(1, 151)] + ['UNKNOWN-1']
+            claimed = await client.claim_scrapes_by_codes('run-a', codes)
+
+            assert sorted(row['id'] for row in claimed) == list(range(1, 151))
+            assert server.stats['requests'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_flush_drops_only_the_scrape_d1_rejects():
+    async def scenario():
+        flushed = []
+        async with local_d1(scrapes=6, flush_size=10, on_flush=flushed.extend) as (server, client):
+            bad = commit(4)
+            # attachments.filename is NOT NULL: D1 rejects the whole batch
+            bad['attachments'][0]['filename'] = None
+            for scrape_id in range(1, 7):
+                await client.queue_commit(bad if scrape_id == 4 else commit(scrape_id))
+            await client.flush()
+
+            assert client._pending == {}
+            assert list(client.rejected) == [4]
+            assert 'NOT NULL' in client.stats()['rejected_scrapes'][4]
+            assert sorted(flushed) == [1, 2, 3, 5, 6]
+            assert rows(server, "SELECT id, scrape_status FROM document_scrapes WHERE scrape_status = 'scraped'") == [
+                {'id': i, 'scrape_status': 'scraped'} for i in (1, 2, 3, 5, 6)
+            ]
+            assert rows(server, "SELECT COUNT(*) AS n FROM attachments WHERE document_scrape_id = 4") == [{'n': 0}]
+
+    asyncio.run(scenario())
+
+
+def test_transient_flush_failure_requeues_without_overwriting_newer_writes():
+    async def scenario():
+        async with local_d1(scrapes=2, flush_size=10) as (server, client):
+            await client.queue_commit(commit(1))
+            await client.queue_commit(commit(2))
+            server.error_rate = 1.0
+            flush = asyncio.create_task(client.flush())
+            await asyncio.sleep(0)
+            # Scrape 2 fails permanently while the first flush is in flight
+            await client.queue_failure(2, 'HTTP 404', transient=False)
+            try:
+                await flush
+            except Exception:
+                pass
+            else:
+                raise AssertionError('flush should have failed')
+
+            assert sorted(client._pending) == [1, 2]
+            server.error_rate = 0.0
+            await client.flush()
+
+            assert rows(server, "SELECT id, scrape_status FROM document_scrapes ORDER BY id") == [
+                {'id': 1, 'scrape_status': 'scraped'},
+                {'id': 2, 'scrape_status': 'failed'}
+            ]
+
+    asyncio.run(scenario())
+
+
+def test_overlapping_claims_never_share_a_row():
+    async def scenario():
+        async with local_d1(scrapes=10) as (server, client):
+            first, second = await asyncio.gather(
+                client.claim_scrapes('run-a', limit=6),
+                client.claim_scrapes('run-b', limit=6)
+            )
+            first = {row['id'] for row in first}
+            second = {row['id'] for row in second}
+            assert not first & second
+            assert first | second == set(range(1, 11))
+            assert rows(server, "SELECT lease_owner, COUNT(*) AS n FROM document_scrapes GROUP BY lease_owner") == [
+                {'lease_owner': 'run-a', 'n': len(first)},
+                {'lease_owner': 'run-b', 'n': len(second)}
+            ]
+
+    asyncio.run(scenario())
+
+
+def test_claim_reclaims_expired_and_stale_unleased_rows_only():
+    async def scenario():
+        async with local_d1(scrapes=5) as (server, client):
+            await client.claim_scrapes('crashed', limit=5, lease_seconds=3600)
+            set_row(server, 1, lease_expires_at=ago(60))
+            set_row(server, 2, lease_owner=None, lease_expires_at=None, updated_at=ago(7200))
+            set_row(server, 3, lease_owner=None, lease_expires_at=None, updated_at=ago(60))
+            set_row(server, 4, lease_owner=None, lease_expires_at=None, updated_at=None)
+
+            claimed = await client.claim_scrapes('run-b', limit=10, lease_seconds=3600)
+
+            # 3 has no lease but was touched recently; 5 is still leased
+            assert sorted(row['id'] for row in claimed) == [1, 2, 4]
+            assert rows(server, "SELECT id, lease_owner FROM document_scrapes ORDER BY id") == [
+                {'id': 1, 'lease_owner': 'run-b'},
+                {'id': 2, 'lease_owner': 'run-b'},
+                {'id': 3, 'lease_owner': None},
+                {'id': 4, 'lease_owner': 'run-b'},
+                {'id': 5, 'lease_owner': 'crashed'}
+            ]
+
+    asyncio.run(scenario())
+
+
+def test_claim_takes_over_live_leases_of_reclaim_owners():
+    async def scenario():
+        async with local_d1(scrapes=4) as (server, client):
+            await client.claim_scrapes('interrupted', limit=2)
+            await client.claim_scrapes('other-run', limit=2)
+
+            claimed = await client.claim_scrapes('resumed', limit=10, reclaim_owners=['interrupted'])
+
+            assert sorted(row['id'] for row in claimed) == [1, 2]
+
+    asyncio.run(scenario())
+
+
+def test_claim_by_codes_skips_rows_another_run_holds():
+    async def scenario():
+        async with local_d1(scrapes=4) as (server, client):
+            await client.claim_scrapes('cron', limit=2)
+            await client.claim_scrapes_by_codes('manual', ['LOCAL-3-AG25'])
+            set_row(server, 2, lease_expires_at=ago(60))
+
+            codes = [f"LOCAL-{i}-AG25" for i in range(1, 5)]
+            claimed = await client.claim_scrapes_by_codes('manual', codes)
+
+            # 1 is leased by cron; 2's lease expired; 3 is already ours
+            assert sorted(row['id'] for row in claimed) == [2, 3, 4]
+
+    asyncio.run(scenario())
+
+
+def test_release_returns_only_unfinished_rows_of_the_owner():
+    async def scenario():
+        async with local_d1(scrapes=4) as (server, client):
+            await client.claim_scrapes('run-a', limit=3)
+            await client.claim_scrapes('run-b', limit=1)
+            await client.queue_commit(commit(1))
+            await client.flush()
+
+            await client.release_leases('run-a')
+
+            assert rows(server, "SELECT id, scrape_status, lease_owner FROM document_scrapes ORDER BY id") == [
+                {'id': 1, 'scrape_status': 'scraped', 'lease_owner': None},
+                {'id': 2, 'scrape_status': 'pending', 'lease_owner': None},
+                {'id': 3, 'scrape_status': 'pending', 'lease_owner': None},
+                {'id': 4, 'scrape_status': 'scraping', 'lease_owner': 'run-b'}
+            ]
+
+    asyncio.run(scenario())
+
+
+def test_failures_schedule_exponential_retries_until_attempts_run_out():
+    async def scenario():
+        options = {'max_attempts': 4, 'retry_base_delay': 60.0, 'retry_max_delay': 150.0}
+        async with local_d1(scrapes=5, **options) as (server, client):
+            await client.claim_scrapes('run-a', limit=5)
+            await client.queue_failure(1, 'timeout', attempts=0)
+            await client.queue_failure(2, 'timeout', attempts=1)
+            await client.queue_failure(3, 'timeout', attempts=2)
+            await client.queue_failure(4, 'timeout', attempts=3)
+            await client.queue_failure(5, 'HTTP 404', attempts=0, transient=False)
+            before = datetime.now(timezone.utc)
+            await client.flush()
+
+            result = rows(
+                server,
+                "SELECT id, scrape_status, scrape_attempts, next_attempt_at, lease_owner "
+                "FROM document_scrapes ORDER BY id"
+            )
+            delays = [
+                round((datetime.fromisoformat(row['next_attempt_at']) - before).total_seconds())
+                if row['next_attempt_at'] else None
+                for row in result
+            ]
+            assert [row['scrape_status'] for row in result] == ['retry', 'retry', 'retry', 'failed', 'failed']
+            assert [row['scrape_attempts'] for row in result] == [1, 1, 1, 1, 1]
+            # 60 s, 120 s, then capped at 150 s
+            assert delays == [60, 120, 150, None, None]
+            assert {row['lease_owner'] for row in result} == {None}
+
+    asyncio.run(scenario())
+
+
+def test_claim_takes_due_retries_after_pending_work():
+    async def scenario():
+        async with local_d1(scrapes=5, max_attempts=3) as (server, client):
+            set_row(server, 1, scrape_status='retry', next_attempt_at=ago(60), scrape_attempts=1)
+            set_row(server, 2, scrape_status='retry', next_attempt_at=ago(-60), scrape_attempts=1)
+            set_row(server, 3, scrape_status='retry', next_attempt_at=ago(60), scrape_attempts=3)
+
+            # Pending rows come first
+            claimed = await client.claim_scrapes('run-a', limit=2)
+            assert sorted(row['id'] for row in claimed) == [4, 5]
+
+            # 2 is not due yet and 3 has no attempts left
+            claimed = await client.claim_scrapes('run-a', limit=5)
+            assert [(row['id'], row['scrape_attempts']) for row in claimed] == [(1, 1)]
+
+    asyncio.run(scenario())
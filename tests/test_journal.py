@@ -0,0 +1,98 @@
+"""
+Journal replay and compaction for resuming an interrupted run.
+"""
+
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from src.journal import Journal
+
+COMMIT = {'scrape_id': 1, 'r2_folder': 'raw/A/', 'attachment_count': 0, 'total_file_size': 10, 'attachments': []}
+
+
+def interrupted_run(path: str, owner: str = 'run-1') -> Journal:
+    """A journal left behind by a run that died without closing it"""
+    journal = Journal(path)
+    journal.open(owner, keep_unfinished=False)
+    journal.record('file', 'A', scrape_id=1, key='raw/A/purchase_order.pdf', filename='purchase_order.pdf', size=10)
+    journal.record('uploaded', 'A', scrape_id=1, commit=COMMIT)
+    journal.record('file', 'B', scrape_id=2, key='raw/B/purchase_order.pdf', filename='purchase_order.pdf', size=20)
+    journal.record('uploaded', 'C', scrape_id=3, commit={**COMMIT, 'scrape_id': 3})
+    journal.record('committed', 'C', scrape_id=3)
+    journal._file.close()
+    return journal
+
+
+def test_resume_replays_unfinished_codes(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    interrupted_run(path)
+
+    journal = Journal(path)
+    journal.load()
+    assert set(journal.unfinished()) == {'A', 'B'}
+    journal.open('run-2')
+
+    assert journal.uploaded('A') == COMMIT
+    assert journal.uploaded('B') is None
+    assert list(journal.files('B')) == ['raw/B/purchase_order.pdf']
+    assert journal.uploaded('C') is None and journal.files('C') == {}
+    assert journal.owners == ['run-1', 'run-2']
+    asyncio.run(journal.close())
+
+    # The compacted file replays to the same state
+    reloaded = Journal(path)
+    reloaded.load()
+    assert set(reloaded.unfinished()) == {'A', 'B'}
+    assert reloaded.uploaded('A') == COMMIT
+    assert reloaded.owners == ['run-1', 'run-2']
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    interrupted_run(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"event": "file", "code": "D", "ke')
+
+    journal = Journal(path)
+    journal.load()
+    assert set(journal.unfinished()) == {'A', 'B'}
+
+
+def test_open_drops_expired_entries_and_their_owners(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    old = (datetime.now(timezone.utc) - timedelta(hours=2)).isoformat()
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in [
+            {'event': 'run', 'owner': 'run-1'},
+            {'event': 'uploaded', 'at': old, 'code': 'A', 'scrape_id': 1, 'owner': 'run-1', 'commit': COMMIT},
+            {'event': 'run', 'owner': 'run-2'},
+        ]:
+            f.write(json.dumps(record) + '\n')
+    interrupted = Journal(path)
+    interrupted.load()
+    interrupted.open('run-2')
+    interrupted.record('file', 'B', scrape_id=2, key='raw/B/x.pdf', filename='x.pdf', size=1)
+    interrupted._file.close()
+
+    journal = Journal(path, max_age=3600)
+    journal.load()
+    journal.open('run-3')
+    asyncio.run(journal.close())
+
+    assert set(journal.state) == {'B'}
+    assert journal.owners == ['run-2', 'run-3']
+
+
+def test_fresh_run_starts_an_empty_journal(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    interrupted_run(path)
+
+    journal = Journal(path)
+    journal.load()
+    journal.open('run-2', keep_unfinished=False)
+    asyncio.run(journal.close())
+
+    assert journal.state == {}
+    with open(path, encoding='utf-8') as f:
+        assert [json.loads(line)['event'] for line in f] == ['run']
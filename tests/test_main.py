@@ -0,0 +1,133 @@
+"""
+ScraperOrchestrator stages against the local D1 stand-in.
+"""
+
+import asyncio
+import importlib
+
+import pytest
+
+from tests.test_d1_client import commit, rows
+from tests.test_journal import COMMIT, interrupted_run
+from src.d1_local import LocalD1Server
+
+
+@pytest.fixture
+def orchestrator_env(monkeypatch, tmp_path):
+    """Environment for a ScraperOrchestrator; returns a function that builds one"""
+    # src.main logs to ./scraper.log on import
+    monkeypatch.chdir(tmp_path)
+    for name, value in {
+        'CF_ACCOUNT_ID': 'account',
+        'CF_API_TOKEN': 'token',
+        'D1_DATABASE_ID': 'database',
+        'R2_ACCESS_KEY': 'key',
+        'R2_SECRET_KEY': 'secret',
+        'R2_BUCKET': 'bucket',
+        'D1_FLUSH_SIZE': '1',
+        'D1_FLUSH_INTERVAL': '3600',
+        'D1_BREAKER_THRESHOLD': '1000',
+        'JOURNAL_PATH': str(tmp_path / 'journal.jsonl'),
+    }.items():
+        monkeypatch.setenv(name, value)
+    main = importlib.import_module('src.main')
+
+    def build(server: LocalD1Server = None, **env):
+        if server:
+            monkeypatch.setenv('D1_API_BASE', server.api_base)
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        orchestrator = main.ScraperOrchestrator()
+        orchestrator.d1.max_retries = 1
+        orchestrator.d1.base_delay = 0.0
+        return orchestrator
+
+    return build
+
+
+def test_commit_accepted_while_d1_fails_counts_as_success(orchestrator_env):
+    async def scenario():
+        async with LocalD1Server(seed=0) as server:
+            server.seed_scrapes(4)
+            orchestrator = orchestrator_env(server)
+            server.error_rate = 1.0
+            try:
+                # flush_size=1: the 4th commit waits for a flush that fails
+                for scrape_id in range(1, 5):
+                    await orchestrator.commit_stage({
+                        'scrape_id': scrape_id,
+                        'chilecompra_code': f"LOCAL-{scrape_id}-AG25",
+                        'scrape_attempts': 0,
+                        'commit': commit(scrape_id, attachments=2)
+                    })
+                await asyncio.gather(*orchestrator.d1._background_flushes)
+
+                assert orchestrator.stats['succeeded'] == 4
+                assert orchestrator.stats['failed'] == 0
+
+                server.error_rate = 0.0
+                await orchestrator.d1.flush()
+            finally:
+                await orchestrator.d1.close()
+                await orchestrator.scraper.close()
+                orchestrator.r2.close()
+
+            assert rows(server, "SELECT DISTINCT scrape_status FROM document_scrapes") == [
+                {'scrape_status': 'scraped'}
+            ]
+            assert rows(server, "SELECT COUNT(*) AS n FROM attachments") == [{'n': 8}]
+
+    asyncio.run(scenario())
+
+
+def test_dry_run_commit_has_no_attachment_rows(orchestrator_env):
+    async def scenario():
+        orchestrator = orchestrator_env(DRY_RUN='true')
+        try:
+            job = await orchestrator.upload_stage({
+                'scrape_id': 1,
+                'chilecompra_code': 'LOCAL-1-AG25',
+                'parsed': {'pdf_report_url': 'https://example.test/report', 'attachments_url': None},
+                'result': {
+                    'pdf_report': None,
+                    'attachments': [
+                        {'filename': 'a.pdf', 'file_type': 'pdf', 'size': 10, 'file': None},
+                        {'filename': 'b.pdf', 'file_type': 'pdf', 'size': 20, 'file': None}
+                    ],
+                    'failed_attachments': [{'filename': 'c.pdf', 'error': 'Download failed'}]
+                }
+            })
+        finally:
+            orchestrator.r2.close()
+        return job['commit']
+
+    commit = asyncio.run(scenario())
+    assert commit['attachment_count'] == 2
+    assert commit['total_file_size'] == 0
+    assert commit['attachments'] == []
+
+
+def test_resumed_jobs_skip_finished_stages(orchestrator_env, tmp_path):
+    interrupted_run(str(tmp_path / 'journal.jsonl'))
+    orchestrator = orchestrator_env(RESUME='true')
+    try:
+        orchestrator.journal.load()
+        orchestrator.journal.open(orchestrator.lease_owner)
+        scrapes = [
+            {'id': scrape_id, 'chilecompra_code': code, 'detail_url': f"https://example.test/{code}"}
+            for scrape_id, code in [(1, 'A'), (2, 'B'), (4, 'D')]
+        ]
+        uploaded, partial, new = (orchestrator._new_job(scrape) for scrape in scrapes)
+
+        async def fetch(job):
+            raise AssertionError(f"{job['chilecompra_code']} should not be fetched")
+
+        assert asyncio.run(orchestrator._unless_uploaded(fetch)(uploaded)) is uploaded
+    finally:
+        asyncio.run(orchestrator.journal.close())
+        orchestrator.r2.close()
+
+    assert uploaded['commit'] == COMMIT
+    assert list(partial['journaled_files']) == ['raw/B/purchase_order.pdf']
+    assert 'commit' not in new and 'journaled_files' not in new
+    assert orchestrator.stats['resumed'] == 2
@@ -0,0 +1,71 @@
+"""
+MercadoPublicoScraper against a local aiohttp server: streamed detail pages.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+from src.bench_parsers import DEFAULT_CORPUS, load_corpus
+from src.mercadopublico import MercadoPublicoScraper
+from src.parsing import LxmlParser
+
+PAGES = {page['name']: page for page in load_corpus(DEFAULT_CORPUS)['pages']}
+NO_LINKS = "<html><body><p>Orden de compra no disponible</p>" + "<p>relleno</p>" * 5000 + "</body></html>"
+
+
+@asynccontextmanager
+async def detail_site(html: str):
+    """Serve `html` as the detail page; yields (page URL, request counter)"""
+    requests = []
+
+    async def detail(request: web.Request) -> web.Response:
+        requests.append(request.path)
+        return web.Response(text=html, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get(MercadoPublicoScraper.DETAIL_PATH, detail)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        yield f"http://127.0.0.1:{port}{MercadoPublicoScraper.DETAIL_PATH}?codigoOC=LOCAL-1-AG25", requests
+    finally:
+        await runner.cleanup()
+
+
+async def fetch_streamed(html: str):
+    scraper = MercadoPublicoScraper(
+        delay_range=(1.0, 1.0),
+        requests_per_second=1000,
+        chunk_size=1024,
+        stream_detail=True
+    )
+    try:
+        async with detail_site(html) as (url, requests):
+            parsed = await scraper.fetch_parsed_detail(url)
+    finally:
+        await scraper.close()
+    return parsed, len(requests), scraper.parse_stats
+
+
+def test_stream_stops_once_both_urls_are_found():
+    html = PAGES['detail_typical']['html']
+    parsed, requests, stats = asyncio.run(fetch_streamed(html))
+
+    assert parsed == LxmlParser().parse_detail(html, MercadoPublicoScraper.BASE_URL)
+    assert requests == 1
+    assert stats['early_exit'] == 1
+    assert stats['stream_fallback'] == 0
+
+
+def test_page_without_urls_is_parsed_from_the_streamed_body():
+    parsed, requests, stats = asyncio.run(fetch_streamed(NO_LINKS))
+
+    assert parsed == {'pdf_report_url': None, 'attachments_url': None}
+    assert requests == 1
+    assert stats['early_exit'] == 0
+    assert stats['stream_fallback'] == 1
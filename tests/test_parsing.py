@@ -0,0 +1,52 @@
+"""
+The lxml backend and the incremental detail parser must return exactly
+what the BeautifulSoup reference returns on every page of the corpus.
+"""
+
+import pytest
+
+from src.bench_parsers import DEFAULT_CORPUS, load_corpus
+from src.parsing import DetailStreamParser, LxmlParser, SoupParser
+
+CORPUS = load_corpus(DEFAULT_CORPUS)
+BASE_URL = CORPUS['base_url']
+PAGES = {page['name']: page for page in CORPUS['pages']}
+DETAIL_PAGES = [name for name, page in PAGES.items() if page['kind'] == 'detail']
+ATTACHMENTS_PAGES = [name for name, page in PAGES.items() if page['kind'] == 'attachments']
+
+soup = SoupParser()
+lxml = LxmlParser()
+
+
+@pytest.mark.parametrize('name', DETAIL_PAGES)
+def test_detail_backends_agree(name):
+    html = PAGES[name]['html']
+    expected = soup.parse_detail(html, BASE_URL)
+    assert expected['pdf_report_url'] or expected['attachments_url']
+    assert lxml.parse_detail(html, BASE_URL) == expected
+
+
+@pytest.mark.parametrize('name', ATTACHMENTS_PAGES)
+def test_attachments_backends_agree(name):
+    page = PAGES[name]
+    expected = soup.parse_attachments(page['html'], page['url'], BASE_URL)
+    assert lxml.parse_attachments(page['html'], page['url'], BASE_URL) == expected
+
+
+@pytest.mark.parametrize('name', list(PAGES))
+def test_form_fields_agree(name):
+    html = PAGES[name]['html']
+    expected = soup.form_fields(html)
+    assert '__VIEWSTATE' in expected
+    assert lxml.form_fields(html) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 1000, 64 * 1024, 10 ** 7])
+@pytest.mark.parametrize('name', DETAIL_PAGES)
+def test_stream_detail_matches_full_parse(name, chunk_size):
+    html = PAGES[name]['html']
+    parser = DetailStreamParser(BASE_URL)
+    for offset in range(0, len(html), chunk_size):
+        if parser.feed(html[offset:offset + chunk_size]):
+            break
+    assert parser.close() == soup.parse_detail(html, BASE_URL)
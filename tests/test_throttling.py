@@ -0,0 +1,106 @@
+"""
+AdaptiveConcurrencyLimiter: latency spike detection, warm-up and cooldown.
+"""
+
+import asyncio
+
+from src.throttling import AdaptiveConcurrencyLimiter
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def limiter(**options) -> AdaptiveConcurrencyLimiter:
+    return AdaptiveConcurrencyLimiter(initial=8, max_limit=8, **options)
+
+
+def test_jitter_on_a_fast_endpoint_is_not_a_spike():
+    async def scenario():
+        concurrency = limiter()
+        # Baseline ~5 ms, then a few responses 8x slower but only by 35 ms
+        for latency in [0.005] * 10 + [0.04] * 5:
+            concurrency.on_success(latency, kind='GET /fast')
+        return concurrency
+
+    concurrency = run(scenario())
+    assert concurrency.decreases == 0
+    assert concurrency.current_limit == 8
+
+
+def test_sustained_slowdown_is_a_spike():
+    async def scenario():
+        concurrency = limiter()
+        for latency in [0.2] * 10 + [2.0] * 5:
+            concurrency.on_success(latency, kind='GET /detail')
+        return concurrency
+
+    concurrency = run(scenario())
+    assert concurrency.decreases == 1
+    assert concurrency.current_limit == 4
+
+
+def test_warm_up_never_signals_a_spike():
+    async def scenario():
+        concurrency = limiter(latency_min_samples=5)
+        # One fast first response, then the real latency
+        for latency in [0.01, 2.0, 2.0, 2.0, 2.0]:
+            concurrency.on_success(latency, kind='GET /detail')
+        return concurrency
+
+    concurrency = run(scenario())
+    assert concurrency.decreases == 0
+    ewma, baseline, samples = concurrency._latency['GET /detail']
+    assert samples == 5
+    assert baseline == ewma
+
+
+def test_kinds_have_separate_baselines():
+    async def scenario():
+        concurrency = limiter()
+        for _ in range(10):
+            concurrency.on_success(0.05, kind='GET /detail')
+            concurrency.on_success(1.5, kind='POST /attachments')
+        return concurrency
+
+    concurrency = run(scenario())
+    assert concurrency.decreases == 0
+
+
+def test_cooldown_counts_one_cut_per_window():
+    async def scenario():
+        concurrency = limiter(cooldown=0.05)
+        for _ in range(3):
+            concurrency.on_overload('http_503')
+        assert concurrency.decreases == 1
+        assert concurrency.current_limit == 4
+
+        await asyncio.sleep(0.06)
+        concurrency.on_overload('http_503')
+        assert concurrency.decreases == 2
+        assert concurrency.current_limit == 2
+
+    run(scenario())
+
+
+def test_limit_increase_wakes_waiters():
+    async def scenario():
+        concurrency = AdaptiveConcurrencyLimiter(initial=1, max_limit=2, increase=1.0)
+        entered = asyncio.Event()
+
+        async def second():
+            async with concurrency:
+                entered.set()
+
+        async with concurrency:
+            waiter = asyncio.create_task(second())
+            await asyncio.sleep(0)
+            assert not entered.is_set()
+            # Raises the limit to 2 while the first slot is still held
+            concurrency.on_success()
+            assert len(concurrency._notifications) == 1
+            await asyncio.wait_for(entered.wait(), 1)
+        await waiter
+        assert concurrency._notifications == set()
+
+    run(scenario())